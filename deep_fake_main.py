@@ -1,12 +1,26 @@
 # app.py
+import gc
+import io
+import json
 import os
+import queue
 import tempfile
-from flask import Flask, request, jsonify, render_template_string
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify, render_template_string
 import numpy as np
 import cv2
 import tensorflow as tf
 from tensorflow.keras.models import load_model, Model
 
+from embedding_index import EmbeddingIndex
+from faces import FaceDetector, FaceDetectorUnavailable, FaceTracker, crop_box
+from jobs import JobManager, JobQueueFull
+from prediction_cache import PredictionCache, SingleFlight, content_hash, file_fingerprint
+from preprocessing import PREPROCESSING_VERSION, decode_image_cv2, resize_frame
+from serving import BucketedModel, MicroBatcher
+from uploads import InMemoryUploadRequest, UploadFile, iter_batch_results
+
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 200 * 1024 * 1024  # 200 MB limit
 
@@ -16,8 +30,82 @@ LSTM_MODEL_PATH = "lstm_deepfake_detector5.h5"
 SEQ_LEN = 10
 FRAME_STRIDE = 1
 THRESHOLD = 0.5
+SAMPLING_STRATEGY = "head"   # "head", "uniform", "keyframe" or "scene"
+MAX_GRAB_GAP = 30            # seek instead of grab() when jumping further than this
+KEYFRAME_INTERVAL_SEC = 2.0  # assumed GOP length used by "keyframe" sampling
+SCENE_PROBES = 40            # frames probed for shot boundaries by "scene" sampling
+SCENE_CUT_THRESHOLD = 0.4    # HSV histogram Bhattacharyya distance that counts as a cut
+# Face crops (the models were trained on whole frames, so this is opt-in)
+FACE_CROP = False            # score face crops (every face track; full-video mode: the main face only)
+FACE_DETECTOR_MODEL = None   # YuNet ONNX file for cv2.FaceDetectorYN; None: OpenCV's bundled Haar cascade
+FACE_DETECT_EVERY = 5        # sampled frames between detector runs; boxes are tracked in between
+FACE_MAX_DETECTIONS = 8      # detector runs allowed per video
+FACE_MAX_TRACKS = 4          # faces tracked and scored per video or image
+FACE_MIN_TRACK_FRAMES = 3    # shorter tracks (of the SEQ_LEN sampled frames) are ignored
+FACE_MARGIN = 0.25           # context kept around each face box, as a fraction of its size
+# Full-video ("mode=full") scoring
+FULL_VIDEO_STRIDE = 5        # sample every Nth frame of the video
+MAX_FULL_VIDEO_FRAMES = 600  # spread samples uniformly when a video has more
+WINDOW_HOP = 5               # sampled frames between consecutive LSTM windows
+WINDOW_AGGREGATE = "max"     # "max", "mean" or "topk"
+WINDOW_TOP_K = 3
+# Streaming pipeline bounds, per request: at most (PREFETCH_CHUNKS + 2) *
+# FRAME_CHUNK preprocessed frames are in flight (the chunk being filled by the
+# decode thread, PREFETCH_CHUNKS queued, the one in feat_extractor), plus
+# one raw decoded frame, SEQ_LEN trailing features and WINDOW_BATCH windows
+FRAME_CHUNK = 32             # frames per feat_extractor call
+WINDOW_BATCH = 64            # windows per lstm call
+PREFETCH_CHUNKS = 2          # decoded chunks queued ahead of the CNN
+# Early exit for full-video scoring: stop decoding once the verdict is settled
+EARLY_EXIT = True
+EARLY_EXIT_MARGIN = 0.25     # a window is "settled" when |score - THRESHOLD| exceeds this
+EARLY_EXIT_PATIENCE = 8      # ...for this many consecutive windows on the same side
+EARLY_EXIT_Z = 3.0           # or when mean ± Z·stderr of all windows clears THRESHOLD ± MARGIN (0 = off)
+EARLY_EXIT_MIN_WINDOWS = 8   # windows needed before the confidence bound is trusted
+# Intra-video frame deduplication: near-identical frames reuse CNN features
+DEDUP_FRAMES = False
+DEDUP_MAX_HAMMING = 2        # dHash bits that may differ for frames to count as duplicates
+DEDUP_MAX_COLOR_DELTA = 3    # ...and 0-255 levels their 2x2 mean-colour thumbnails may differ by
+DEDUP_HISTORY = 64           # distinct frames remembered per video
+SERVING_JIT_COMPILE = False  # XLA-compile the traced serving functions
+# Cross-request micro-batching: concurrent requests' model calls are merged
+BATCH_MAX_SIZE = 32          # rows per merged call
+BATCH_MAX_WAIT_MS = 5        # how long the first request waits for company
+PREDICTION_CACHE_PATH = "prediction_cache.sqlite3"  # shared by all workers on the host
+PREDICTION_CACHE_ITEMS = 1024  # in-memory LRU tier size
+# Identical concurrent uploads wait for one computation (per-key lock files
+# extend this across worker processes on the same host)
+SINGLE_FLIGHT_LOCK_DIR = os.path.join(tempfile.gettempdir(), "deepfake_detector_locks")
+# Near-duplicate index over the pooled CNN embeddings of the scored frames
+# (None disables it).
+# Penultimate features are often non-negative, so keep the threshold high.
+NEAR_DUP_INDEX_DIR = "near_dup_index"
+NEAR_DUP_THRESHOLD = 0.995   # cosine similarity needed to reuse a verdict
+NEAR_DUP_CAPACITY = 100000   # oldest entries are evicted beyond this
+# Asynchronous /jobs API for long videos
+JOB_WORKERS = 2              # inference threads serving queued jobs
+JOB_MAX_PENDING = 64         # POST /jobs answers 503 beyond this many unfinished jobs
+JOB_RESULT_TTL_SEC = 3600    # finished jobs are forgotten after this
+JOB_UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "deepfake_detector_jobs")
+# Live scoring (GET /live/<name> and the --live CLI)
+LIVE_SOURCES = {"webcam": 0}  # the only cv2.VideoCapture sources reachable over HTTP
+LIVE_SCORE_EVERY = 5          # new frames between LSTM window scores
+# Uploads up to this size stay in memory (images are decoded from the bytes,
+# videos opened from a memfd); larger ones are spooled to a temp file
+UPLOAD_MEMORY_LIMIT = 64 * 1024 * 1024
+# POST /predict/batch (limits apply after decompressing archives)
+BATCH_MAX_ITEMS = 500        # files per request, archive members included
+BATCH_MAX_ITEM_BYTES = 64 * 1024 * 1024
+BATCH_MAX_TOTAL_BYTES = 1024 * 1024 * 1024
+BATCH_GROUP = 32             # files decoded concurrently and scored together
+BATCH_DECODE_WORKERS = 4
 # -----------------------------------
 
+class UploadRequest(InMemoryUploadRequest):
+    max_memory = UPLOAD_MEMORY_LIMIT
+
+app.request_class = UploadRequest
+
 print("Loading models...")
 cnn = load_model(CNN_MODEL_PATH)
 lstm = load_model(LSTM_MODEL_PATH)
@@ -48,65 +136,1063 @@ def make_feature_extractor(model):
     print("➡️ Using original CNN output as features (may be probs).")
     return model
 
-feat_extractor = make_feature_extractor(cnn)
+def with_input_normalization(model, input_shape):
+    """
+    Wrap `model` so it takes uint8 BGR frames and does the BGR->RGB swap and
+    [0, 1] scaling in-graph. The decode path can then stay uint8 (4x less data
+    through the host) and TF fuses the normalization into the first layer.
+    """
+    inp = tf.keras.Input(shape=tuple(input_shape), dtype="uint8")
+    x = tf.keras.layers.Lambda(lambda t: tf.reverse(tf.cast(t, tf.float32), axis=[-1]))(inp)
+    x = tf.keras.layers.Rescaling(1.0 / 255)(x)
+    return Model(inputs=inp, outputs=model(x))
+
+def detach_model(model):
+    """
+    Copy `model` into a fresh graph. A penultimate-layer Model still shares
+    layers (and graph links to the classifier head) with the full CNN; a
+    detached copy lets the full CNN be garbage-collected.
+    """
+    clone = tf.keras.models.clone_model(model)
+    clone.set_weights(model.get_weights())
+    return clone
+
+def build_serving_model():
+    """
+    Compose feat_extractor (TimeDistributed) and lstm into one model taking
+    uint8 (batch, SEQ_LEN, H, W, 3) sequences, so a video is scored in a
+    single call with no host round-trip for the features.
+    """
+    if len(lstm.input_shape) == 5:
+        return lstm
+    inp = tf.keras.Input(shape=(SEQ_LEN, IMG_SIZE[0], IMG_SIZE[1], 3), dtype="uint8")
+    feats = tf.keras.layers.TimeDistributed(feat_extractor)(inp)
+    feats = tf.keras.layers.Reshape((SEQ_LEN, -1))(feats)
+    return Model(inputs=inp, outputs=lstm(feats))
+
+feat_extractor = with_input_normalization(detach_model(make_feature_extractor(cnn)),
+                                          (IMG_SIZE[0], IMG_SIZE[1], 3))
+# Only the penultimate-layer features are served; drop the full CNN
+del cnn
+gc.collect()
+if len(lstm.input_shape) == 5:
+    lstm = with_input_normalization(lstm, lstm.input_shape[1:])
 
 # Debug CNN output shape
-dummy = np.random.rand(1, IMG_SIZE[0], IMG_SIZE[1], 3).astype("float32")
+dummy = np.random.randint(0, 256, (1, IMG_SIZE[0], IMG_SIZE[1], 3), dtype=np.uint8)
 try:
     print("CNN output shape:", feat_extractor.predict(dummy, verbose=0).shape)
 except Exception as e:
     print("⚠️ Could not test CNN output:", e)
 
-def preprocess_frame(frame):
-    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    resized = cv2.resize(rgb, IMG_SIZE)
-    return resized.astype("float32") / 255.0
+serving_model = build_serving_model()
 
-def extract_frames_from_video(path, seq_len=SEQ_LEN, stride=FRAME_STRIDE):
-    cap = cv2.VideoCapture(path)
-    frames = []
-    idx = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
+# Concrete functions traced once per batch-size bucket; requests are padded to
+# the nearest bucket so nothing retraces at request time. Each one sits
+# behind a MicroBatcher so concurrent requests share batched calls instead of
+# fighting over TF's intra-op threads.
+def _batched(model, buckets):
+    return MicroBatcher(BucketedModel(model, buckets=buckets, jit_compile=SERVING_JIT_COMPILE),
+                        max_batch=BATCH_MAX_SIZE, max_wait=BATCH_MAX_WAIT_MS / 1000.0)
+
+print("Tracing serving functions...")
+feature_fn = _batched(feat_extractor, (1, 2, 4, 8, 16, 32, 64))
+lstm_fn = _batched(lstm, (1, 2, 4, 8, 16, 32, 64))
+sequence_fn = lstm_fn if serving_model is lstm else _batched(serving_model, (1, 2, 4, 8))
+
+def preprocess_frame(frame, out=None):
+    """
+    BGR frame -> resized uint8 BGR (H, W, 3), optionally written into `out`.
+    Channel order and scaling are handled inside the models
+    (see with_input_normalization).
+    """
+    return resize_frame(frame, (IMG_SIZE[1], IMG_SIZE[0]), out)
+
+face_detector = None
+if FACE_CROP:
+    try:
+        face_detector = FaceDetector(FACE_DETECTOR_MODEL)
+    except FaceDetectorUnavailable as e:
+        print("⚠️ Face crops disabled, no face detector:", e)
+
+def new_face_tracker():
+    """A FaceTracker for one video or image, or None when FACE_CROP is off."""
+    if face_detector is None:
+        return None
+    return FaceTracker(face_detector, detect_every=FACE_DETECT_EVERY, max_detections=FACE_MAX_DETECTIONS,
+                       max_faces=FACE_MAX_TRACKS)
+
+def iter_face_crops(frames, faces, stats):
+    """
+    Crop the raw frames of a full-video pass to one face: the largest face of
+    the first frame in which the tracker finds any, followed by its track and
+    kept at its last known box while the track is lost. Every yielded frame
+    is a crop of that face, never a whole frame; frames before it appears are
+    skipped. stats["face_crops"] counts the crops.
+    """
+    stats["face_crops"] = 0
+    main = box = None
+    for frame in frames:
+        if faces.frames == 0:
+            faces.plan(stats.get("planned", 0))
+        visible = dict(faces.update(frame))
+        if main is None and visible:
+            main = max(visible, key=lambda t: visible[t][2] * visible[t][3])
+        if main is None:
+            continue
+        box = visible.get(main, box)
+        stats["face_crops"] += 1
+        yield crop_box(frame, box, FACE_MARGIN)
+
+def plan_frame_indices(frame_count, fps, seq_len=SEQ_LEN, stride=FRAME_STRIDE,
+                       strategy=SAMPLING_STRATEGY):
+    """
+    Work out up front which frame indices to decode.
+    "head" keeps the first seq_len frames at `stride` (the original behaviour),
+    "uniform" spreads them over the whole video and "keyframe" snaps them to
+    estimated GOP boundaries so every seek lands on a cheap-to-decode frame.
+    ("scene" needs the content and goes through select_scene_frames; here it
+    only covers the unknown-length fallback.)
+    """
+    stride = max(1, int(stride))
+    if strategy in ("head", "scene") or frame_count <= 0:
+        # Unknown length (some containers/streams) can only be read from the start
+        return list(range(0, seq_len * stride, stride))
+
+    if strategy == "keyframe" and fps > 0:
+        gop = max(1, int(round(fps * KEYFRAME_INTERVAL_SEC)))
+        keyframes = np.arange(0, frame_count, gop)
+        if len(keyframes) >= seq_len:
+            pick = np.linspace(0, len(keyframes) - 1, seq_len).round().astype(int)
+            return sorted(set(keyframes[pick].tolist()))
+        # Too few keyframes for a full sequence: fall through to uniform
+
+    if strategy not in ("uniform", "keyframe"):
+        raise ValueError(f"unknown sampling strategy: {strategy}")
+    n = min(seq_len, frame_count)
+    return sorted(set(np.linspace(0, frame_count - 1, n).round().astype(int).tolist()))
+
+def _read_frame_at(cap, pos, target):
+    """
+    Move `cap` from frame `pos` to `target` and decode only that frame.
+    Short gaps are skipped with grab() (no retrieve/colour conversion),
+    long or backward gaps with a container seek. Returns (frame, new_pos).
+    """
+    if target < pos or target - pos > MAX_GRAB_GAP:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+    else:
+        while pos < target:
+            if not cap.grab():
+                return None, pos
+            pos += 1
+    ret, frame = cap.read()
+    return (frame if ret else None), target + 1
+
+def _shot_histogram(frame):
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 16], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+def allocate_shot_samples(shot_lengths, n):
+    """
+    Split n samples over shots: every shot gets one (only the longest shots
+    when there are more shots than samples) and the rest go to whichever shot
+    has the most length per sample, never exceeding a shot's length.
+    """
+    lengths = np.asarray(shot_lengths, dtype=np.float64)
+    counts = np.zeros(len(lengths), dtype=int)
+    if n <= len(lengths):
+        counts[np.argsort(-lengths, kind="stable")[:n]] = 1
+        return counts
+    counts[:] = 1
+    for _ in range(min(n, int(lengths.sum())) - len(lengths)):
+        share = np.where(counts < lengths, lengths / (counts + 1), -1.0)
+        counts[int(np.argmax(share))] += 1
+    return counts
+
+def select_scene_frames(cap, frame_count, seq_len, out):
+    """
+    Scene-change-aware selection. Decodes SCENE_PROBES frames spread over the
+    video, downscales them to IMG_SIZE, splits them into shots wherever the
+    HSV histogram jumps, then picks seq_len of those probes spread across the
+    shots. The probes double as the samples, so no frame is decoded twice and
+    every shot is covered before any shot gets a second sample.
+    Writes into `out` and returns the number of frames written.
+    """
+    probe_indices = sorted(set(np.linspace(0, frame_count - 1, min(SCENE_PROBES, frame_count))
+                               .round().astype(int).tolist()))
+    probes = np.empty((len(probe_indices),) + out.shape[1:], dtype=out.dtype)
+    shots = []
+    prev_hist = None
+    pos = 0
+    n_probes = 0
+    for target in probe_indices:
+        frame, pos = _read_frame_at(cap, pos, target)
+        if frame is None:
             break
-        if idx % stride == 0:
-            frames.append(preprocess_frame(frame))
-        idx += 1
+        small = preprocess_frame(frame, out=probes[n_probes])
+        hist = _shot_histogram(small)
+        if prev_hist is None or cv2.compareHist(prev_hist, hist, cv2.HISTCMP_BHATTACHARYYA) > SCENE_CUT_THRESHOLD:
+            shots.append([])
+        shots[-1].append(n_probes)
+        prev_hist = hist
+        n_probes += 1
+
+    n = 0
+    counts = allocate_shot_samples([len(shot) for shot in shots], seq_len)
+    for shot, count in zip(shots, counts):
+        # Evenly spaced, centred picks within the shot
+        for j in ((np.arange(count) + 0.5) * len(shot) / max(count, 1)).astype(int):
+            out[n] = probes[shot[j]]
+            n += 1
+    return n
+
+def extract_frames_from_video(path, seq_len=SEQ_LEN, stride=FRAME_STRIDE,
+                              strategy=SAMPLING_STRATEGY):
+    """
+    Decode and preprocess the single-window sample of a video. Returns
+    (frames, n): the uint8 (seq_len, H, W, 3) window, padded with its last
+    frame, and how many frames were actually decoded (0: undecodable).
+    """
+    cap = cv2.VideoCapture(path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    # Kept frames are written straight into one preallocated tensor
+    frames = np.empty((seq_len, IMG_SIZE[0], IMG_SIZE[1], 3), dtype=np.uint8)
+    if strategy == "scene" and frame_count > 0:
+        n = select_scene_frames(cap, frame_count, seq_len, frames)
+    else:
+        indices = plan_frame_indices(frame_count, fps, seq_len, stride, strategy)
+        n = 0
+        pos = 0
+        for target in indices[:seq_len]:
+            frame, pos = _read_frame_at(cap, pos, target)
+            if frame is None:
+                break
+            preprocess_frame(frame, out=frames[n])
+            n += 1
     cap.release()
 
-    if len(frames) == 0:
-        return np.zeros((seq_len, IMG_SIZE[0], IMG_SIZE[1], 3), dtype=np.float32)
+    if n == 0:
+        frames.fill(0)
+    elif n < seq_len:
+        # Pad by broadcasting the last frame over the tail, no per-frame copies
+        frames[n:] = frames[n - 1]
+
+    return frames, n
+
+def iter_sampled_frames(path, seq_len=SEQ_LEN, stride=FRAME_STRIDE, strategy=SAMPLING_STRATEGY):
+    """
+    Raw BGR frames at the single-window sample positions, for stages that need
+    full resolution. "scene" selection works on downscaled probes, so it is
+    replaced by the uniform plan here.
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        strategy = "uniform" if strategy == "scene" else strategy
+        pos = 0
+        for target in plan_frame_indices(frame_count, cap.get(cv2.CAP_PROP_FPS), seq_len, stride, strategy)[:seq_len]:
+            frame, pos = _read_frame_at(cap, pos, target)
+            if frame is None:
+                return
+            yield frame
+    finally:
+        cap.release()
 
-    if len(frames) < seq_len:
-        while len(frames) < seq_len:
-            frames.append(frames[-1])
+def collect_face_tracks(frames, faces, min_frames=1):
+    """
+    Run a FaceTracker over raw frames and preprocess every face crop once.
+    Returns (crops, tracks): crops is uint8 (N, H, W, 3) holding all faces of
+    all frames, tracks maps track id -> crop rows in frame order. Tracks seen
+    in fewer than `min_frames` frames are dropped.
+    """
+    crops = []
+    tracks = {}
+    for frame in frames:
+        for track_id, box in faces.update(frame):
+            tracks.setdefault(track_id, []).append(len(crops))
+            crops.append(preprocess_frame(crop_box(frame, box, FACE_MARGIN)))
+    tracks = {t: rows for t, rows in tracks.items() if len(rows) >= min_frames}
+    if not tracks:
+        return None, {}
+    return np.stack(crops), tracks
+
+def score_face_tracks(crops, tracks, seq_len=SEQ_LEN):
+    """
+    Score every face track as its own sequence: one batched CNN call over all
+    crops, then one batched LSTM call over the (tracks, seq_len) sequences,
+    instead of a predict_from_frames call per face. Short tracks are padded
+    with their last crop (a single-crop track is a static image sequence).
+    Returns {track_id: probability}.
+    """
+    ids = sorted(tracks)
+    rows = np.array([tracks[t][:seq_len] + [tracks[t][-1]] * (seq_len - len(tracks[t][:seq_len]))
+                     for t in ids])  # (tracks, seq_len) indices into crops
+    if len(lstm.input_shape) == 5:
+        out = sequence_fn(crops[rows])
+    else:
+        feats = feature_fn(crops).reshape((len(crops), -1))
+        out = lstm_fn(feats[rows])
+    return dict(zip(ids, np.array(out).reshape(-1).astype(float).tolist()))
 
-    return np.array(frames[:seq_len])
+def face_track_result(scores, tracks):
+    """Per-face probabilities plus the overall probability: a video is as fake as its most fake face."""
+    faces = [{"track": int(t), "probability": scores[t], "is_fake": bool(scores[t] >= THRESHOLD),
+              "frames": len(tracks[t])} for t in sorted(scores)]
+    return max(scores.values()), faces
 
-def predict_from_frames(frames):
+def predict_from_frames(frames, feats=None):
     """
-    Predict using either (CNN → LSTM) or (Raw Frames → LSTM),
-    depending on what the LSTM model was trained on.
+    Score one uint8 (SEQ_LEN, H, W, 3) sequence with the fused serving model,
+    whether the LSTM was trained on CNN features or on raw frames. When the
+    frames' CNN features are already known (`feats`), only the LSTM runs.
     """
-    frames_b = frames.astype("float32")
+    if feats is not None and len(lstm.input_shape) != 5:
+        out = lstm_fn(feats.reshape((1, len(frames), -1)))
+    else:
+        out = sequence_fn(frames[np.newaxis])
+    return float(np.array(out).reshape(-1)[0])
 
-    # Case 1: LSTM expects raw frames (e.g., (None, 10, H, W, 3))
+def predict_from_image(frame, feats=None):
+    """
+    Score a single preprocessed image as a static SEQ_LEN sequence.
+    The CNN runs once (or not at all when `feats` is already known) and its
+    feature vector is tiled, instead of pushing SEQ_LEN identical frames
+    through feat_extractor.
+    """
     if len(lstm.input_shape) == 5:
-        seq = np.expand_dims(frames_b, axis=0)  # (1, SEQ_LEN, H, W, 3)
-        lstm_out = lstm.predict(seq, verbose=0)
+        seq = np.repeat(frame[np.newaxis, np.newaxis], SEQ_LEN, axis=1)  # (1, SEQ_LEN, H, W, 3)
+    else:
+        if feats is None:
+            feats = feature_fn(frame[np.newaxis])
+        seq = np.repeat(feats.reshape((1, 1, -1)), SEQ_LEN, axis=1)  # (1, SEQ_LEN, feature_dim)
+    lstm_out = lstm_fn(seq)
+    return float(np.array(lstm_out).reshape(-1)[0])
+
+def plan_full_video_indices(frame_count, stride=FULL_VIDEO_STRIDE,
+                            max_frames=MAX_FULL_VIDEO_FRAMES):
+    """Indices covering the whole video at `stride`, thinned to at most max_frames."""
+    stride = max(1, int(stride))
+    if frame_count <= 0:
+        return list(range(0, max_frames * stride, stride))
+    indices = np.arange(0, frame_count, stride)
+    if len(indices) > max_frames:
+        indices = np.linspace(0, frame_count - 1, max_frames).round().astype(int)
+    return sorted(set(indices.tolist()))
+
+def iter_video_frames(path, stride=FULL_VIDEO_STRIDE, max_frames=MAX_FULL_VIDEO_FRAMES, stats=None):
+    """Yield raw BGR frames sampled across the whole video, one decode at a time."""
+    cap = cv2.VideoCapture(path)
+    try:
+        indices = plan_full_video_indices(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), stride, max_frames)
+        if stats is not None:
+            stats["planned"] = len(indices)
+        pos = 0
+        for target in indices:
+            frame, pos = _read_frame_at(cap, pos, target)
+            if frame is None:
+                return
+            yield frame
+    finally:
+        cap.release()
+
+def iter_frame_chunks(frames, chunk=FRAME_CHUNK, stats=None):
+    """Group decoded frames into preprocessed uint8 (<=chunk, H, W, 3) arrays."""
+    buf = None
+    n = 0
+    for frame in frames:
+        if buf is None:
+            buf = np.empty((chunk, IMG_SIZE[0], IMG_SIZE[1], 3), dtype=np.uint8)
+        preprocess_frame(frame, out=buf[n])
+        n += 1
+        if stats is not None:
+            stats["frames"] = stats.get("frames", 0) + 1
+        if n == chunk:
+            yield buf
+            buf, n = None, 0
+    if n:
+        yield buf[:n]
+
+def prefetch(iterable, maxsize=PREFETCH_CHUNKS, latest_only=False, stats=None):
+    """
+    Run `iterable` on a producer thread with at most `maxsize` items queued.
+    OpenCV releases the GIL while decoding and resizing, so chunk N+1 is
+    decoded while TensorFlow works on chunk N. Producer exceptions are
+    re-raised here; closing this generator stops the producer and closes
+    `iterable` (releasing its VideoCapture) before returning.
+
+    With `latest_only` (live captures) the producer never waits: a new item
+    replaces one the consumer has not taken yet, so the consumer always gets
+    the newest item instead of falling further behind real time. Replaced
+    items are counted in `stats["dropped"]`.
+    """
+    q = queue.Queue(maxsize=1 if latest_only else maxsize)
+    stop = threading.Event()
+    if stats is not None:
+        stats.setdefault("dropped", 0)
+
+    def replace(msg):
+        # Only this thread puts, so after dropping the stale item there is room
+        try:
+            q.get_nowait()
+            if stats is not None:
+                stats["dropped"] += 1
+        except queue.Empty:
+            pass
+        q.put_nowait(msg)
+        return not stop.is_set()
+
+    def put(msg):
+        while not stop.is_set():
+            try:
+                q.put(msg, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not (replace if latest_only else put)(("item", item)):
+                    break
+            else:
+                put(("end", None))
+        except Exception as e:
+            put(("error", e))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, value = q.get()
+            if kind == "end":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
+        producer.join()
+
+def dhash_frames(frames):
+    """64-bit difference hash of each uint8 BGR frame -> uint64 array."""
+    hashes = np.empty(len(frames), dtype=np.uint64)
+    for i, frame in enumerate(frames):
+        small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (9, 8), interpolation=cv2.INTER_AREA)
+        hashes[i] = np.packbits(small[:, 1:] > small[:, :-1]).view(">u8")[0]
+    return hashes
+
+def color_thumbnails(frames):
+    """2x2 mean-colour thumbnail of each uint8 BGR frame -> float32 (N, 12)."""
+    return np.stack([cv2.resize(frame, (2, 2), interpolation=cv2.INTER_AREA).reshape(-1)
+                     for frame in frames]).astype(np.float32)
+
+def hamming_distances(hashes, h):
+    x = np.bitwise_xor(hashes, np.uint64(h))
+    return np.unpackbits(x.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+class FrameDeduplicator:
+    """
+    Reuse CNN features for near-identical frames within one video (static
+    shots, slideshows, screen recordings). Each frame gets a dHash and a
+    2x2 mean-colour thumbnail; a frame within `max_hamming` bits and
+    `max_color_delta` levels of an earlier distinct frame copies that frame's
+    features instead of running feat_extractor. dHash only sees gradients, so
+    the colour check is what keeps fades and colour grades from reusing
+    stale features. The output still has one feature vector per frame, so the
+    LSTM sees the same sequence length.
+    """
+
+    def __init__(self, max_hamming=DEDUP_MAX_HAMMING, max_color_delta=DEDUP_MAX_COLOR_DELTA,
+                 history=DEDUP_HISTORY):
+        self.max_hamming = max_hamming
+        self.max_color_delta = max_color_delta
+        self.history = history
+        self.hashes = np.empty(0, dtype=np.uint64)   # recent distinct frames...
+        self.colors = np.empty((0, 12), dtype=np.float32)
+        self.feats = None                            # ...and their features
+        self.reused = 0
+
+    def _match(self, hashes, colors, h, color):
+        if len(hashes) == 0:
+            return None
+        dist = hamming_distances(hashes, h)
+        close = (dist <= self.max_hamming) & (np.abs(colors - color).max(axis=1) <= self.max_color_delta)
+        if not close.any():
+            return None
+        return int(np.argmin(np.where(close, dist, np.iinfo(dist.dtype).max)))
+
+    def featurize(self, chunk):
+        hashes = dhash_frames(chunk)
+        colors = color_thumbnails(chunk)
+        unique = []                                   # chunk positions that need the CNN
+        source = np.empty(len(chunk), dtype=np.int64)  # >= 0: row of new feats, < 0: -(history row + 1)
+        for i, (h, color) in enumerate(zip(hashes, colors)):
+            j = self._match(self.hashes, self.colors, h, color)
+            if j is not None:
+                source[i] = -(j + 1)
+                continue
+            k = self._match(hashes[unique], colors[unique], h, color)
+            if k is not None:
+                source[i] = k
+                continue
+            source[i] = len(unique)
+            unique.append(i)
+
+        new_feats = feature_fn(chunk[unique]).reshape((len(unique), -1)) if unique else None
+        dim = (new_feats if new_feats is not None else self.feats).shape[1]
+        feats = np.empty((len(chunk), dim), dtype=np.float32)
+        fresh = source >= 0
+        if new_feats is not None:
+            feats[fresh] = new_feats[source[fresh]]
+        if not fresh.all():
+            feats[~fresh] = self.feats[-source[~fresh] - 1]
+        self.reused += len(chunk) - len(unique)
+
+        if new_feats is not None:
+            self.hashes = np.concatenate([self.hashes, hashes[unique]])[-self.history:]
+            self.colors = np.concatenate([self.colors, colors[unique]])[-self.history:]
+            self.feats = new_feats if self.feats is None else np.concatenate([self.feats, new_feats])[-self.history:]
+        return feats
+
+def iter_feature_chunks(chunks, dedup=None):
+    """
+    Turn frame chunks into the per-frame items the LSTM consumes: CNN feature
+    vectors (through `dedup` when given), or the frames themselves when the
+    LSTM takes raw 5-D input.
+    """
+    for chunk in chunks:
+        if len(lstm.input_shape) == 5:
+            yield chunk
+        elif dedup is not None:
+            yield dedup.featurize(chunk)
+        else:
+            feats = feature_fn(chunk)
+            yield feats.reshape((len(chunk), -1))
 
-    # Case 2: LSTM expects CNN features (e.g., (None, 10, feature_dim))
+class SlidingWindows:
+    """
+    Cut overlapping seq_len windows every `hop` items out of a stream of item
+    chunks while holding only the current chunk plus the last seq_len items.
+    Short inputs are padded with their last item, and finish() always emits
+    the final window so the tail of the video is scored even when hop doesn't
+    divide its length.
+    """
+
+    def __init__(self, seq_len=SEQ_LEN, hop=WINDOW_HOP):
+        self.seq_len = seq_len
+        self.hop = max(1, int(hop))
+        self.tail = None        # last <= seq_len items seen so far
+        self.base = 0           # absolute index of tail[0]
+        self.end = 0            # absolute index one past the last item seen
+        self.next_start = 0
+        self.last_start = None
+
+    def push(self, chunk):
+        """Add a chunk of items and return the windows it completes."""
+        buf = chunk if self.tail is None else np.concatenate([self.tail, chunk], axis=0)
+        self.end = self.base + len(buf)
+        windows = []
+        while self.next_start + self.seq_len <= self.end:
+            start = self.next_start - self.base
+            windows.append(buf[start:start + self.seq_len])
+            self.last_start = self.next_start
+            self.next_start += self.hop
+        keep = min(len(buf), self.seq_len)
+        self.tail = np.array(buf[-keep:])
+        self.base = self.end - keep
+        return windows
+
+    def finish(self):
+        """Windows still owed once the stream has ended."""
+        if self.tail is None:
+            return []
+        if self.end < self.seq_len:
+            pad = np.broadcast_to(self.tail[-1], (self.seq_len - self.end,) + self.tail.shape[1:])
+            return [np.concatenate([self.tail, pad], axis=0)]
+        if self.last_start != self.end - self.seq_len:
+            return [self.tail]
+        return []
+
+def _score_window_batch(windows):
+    lstm_out = lstm_fn(np.stack(windows))
+    return np.array(lstm_out).reshape(len(windows), -1)[:, 0]
+
+def aggregate_scores(scores, method=WINDOW_AGGREGATE, k=WINDOW_TOP_K):
+    if method == "max":
+        return float(np.max(scores))
+    if method == "mean":
+        return float(np.mean(scores))
+    if method == "topk":
+        k = max(1, min(int(k), len(scores)))
+        return float(np.mean(np.sort(scores)[-k:]))
+    raise ValueError(f"unknown aggregate: {method}")
+
+class EarlyExitPolicy:
+    """
+    Decide when a full-video verdict is settled so decoding can stop: either
+    `patience` consecutive windows scored more than `margin` away from the
+    threshold on the same side, or (after `min_windows`) a mean ± z·stderr
+    bound over all window scores that lies more than `margin` away from it
+    on one side. Windows `hop` frames apart share seq_len - hop frames, so
+    the stderr counts only n·hop/seq_len of them as independent.
+
+    A real verdict may only settle early under the "mean" aggregate: with
+    "max" or "topk" a single later fake window can still flip it, so only
+    the fake side is allowed to stop decoding.
+    """
+
+    def __init__(self, aggregate=WINDOW_AGGREGATE, threshold=THRESHOLD, margin=EARLY_EXIT_MARGIN,
+                 patience=EARLY_EXIT_PATIENCE, z=EARLY_EXIT_Z, min_windows=EARLY_EXIT_MIN_WINDOWS,
+                 hop=WINDOW_HOP, seq_len=SEQ_LEN):
+        self.real_side_can_settle = aggregate == "mean"
+        self.threshold = threshold
+        self.margin = margin
+        self.patience = patience
+        self.z = z
+        self.min_windows = min_windows
+        self.overlap = max(1.0, seq_len / float(max(1, hop)))
+        self.side = 0
+        self.streak = 0
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def _settled(self, side):
+        return side == 1 or (side == -1 and self.real_side_can_settle)
+
+    def update(self, scores):
+        """Feed newly scored windows; returns the reason once settled, else None."""
+        for x in scores:
+            x = float(x)
+            self.n += 1
+            self.total += x
+            self.total_sq += x * x
+            if x >= self.threshold + self.margin:
+                side = 1
+            elif x <= self.threshold - self.margin:
+                side = -1
+            else:
+                side = 0
+            self.streak = self.streak + 1 if side != 0 and side == self.side else int(side != 0)
+            self.side = side
+            if self.patience and self.streak >= self.patience and self._settled(side):
+                return "consecutive_windows"
+
+        if self.z > 0 and self.n >= self.min_windows:
+            mean = self.total / self.n
+            var = max(self.total_sq / self.n - mean * mean, 0.0)
+            half_width = self.z * np.sqrt(var * self.overlap / self.n)
+            if mean - half_width > self.threshold + self.margin and self._settled(1):
+                return "confidence_bound"
+            if mean + half_width < self.threshold - self.margin and self._settled(-1):
+                return "confidence_bound"
+        return None
+
+def iter_video_events(path, hop=WINDOW_HOP, early_exit=None, faces=None):
+    """
+    Run the bounded-memory pipeline decode -> preprocess -> CNN -> LSTM windows
+    over a whole video, yielding {"event": "chunk"} after every featurized
+    frame chunk and {"event": "windows", "scores": ...} after every scored
+    window batch, both with running "frames_decoded"/"frames_planned" counts.
+    If the optional EarlyExitPolicy settles, a final {"event": "early_exit"}
+    is yielded and the pipeline stops. With a FaceTracker the frames are
+    cropped to the video's main face (iter_face_crops), or, when no face is
+    found anywhere, the whole frames are scored in a second pass, so a video
+    is scored on crops or on whole frames but never a mix. Closing the
+    generator stops decoding and releases the video.
+    """
+    stats = {"frames": 0, "planned": 0}
+    frames = iter_video_frames(path, stats=stats)
+    if faces is not None:
+        frames = iter_face_crops(frames, faces, stats)
+    # Decode/crop/preprocess on a producer thread, overlapping with CNN inference
+    chunks = prefetch(iter_frame_chunks(frames, stats=stats))
+    dedup = FrameDeduplicator() if DEDUP_FRAMES else None
+    windows = SlidingWindows(SEQ_LEN, hop)
+
+    def event(kind, **fields):
+        return dict(fields, event=kind, frames_decoded=stats["frames"], frames_planned=stats["planned"],
+                    frames_reused=dedup.reused if dedup is not None else 0)
+
+    def scored(pending):
+        for start in range(0, len(pending), WINDOW_BATCH):
+            yield event("windows", scores=_score_window_batch(pending[start:start + WINDOW_BATCH]))
+
+    try:
+        for items in iter_feature_chunks(chunks, dedup):
+            yield event("chunk")
+            for windows_event in scored(windows.push(items)):
+                yield windows_event
+                reason = early_exit.update(windows_event["scores"]) if early_exit is not None else None
+                if reason is not None:
+                    yield event("early_exit", reason=reason)
+                    return
+        yield from scored(windows.finish())
+    finally:
+        chunks.close()
+    if faces is not None and stats["face_crops"] == 0:
+        yield from iter_video_events(path, hop, early_exit)
+
+def new_video_info():
+    return {"scores": [], "frames_sampled": 0, "frames_planned": 0, "frames_reused": 0, "early_exit": None}
+
+def track_video_event(info, event):
+    """Fold one iter_video_events event into a new_video_info() dict."""
+    info["frames_sampled"] = event["frames_decoded"]
+    info["frames_planned"] = event["frames_planned"]
+    info["frames_reused"] = event["frames_reused"]
+    if event["event"] == "windows":
+        info["scores"].extend(float(x) for x in event["scores"])
+    elif event["event"] == "early_exit":
+        info["early_exit"] = event["reason"]
+
+def score_video(path, hop=WINDOW_HOP, progress=None, faces=None, aggregate=WINDOW_AGGREGATE):
+    """
+    Score a whole video with overlapping windows, stopping early once its
+    `aggregate` verdict is settled (when EARLY_EXIT is on). Returns a
+    new_video_info() dict.
+    `progress(frames_decoded=..., windows_scored=...)` is called per event.
+    """
+    info = new_video_info()
+    early_exit = EarlyExitPolicy(aggregate, hop=hop) if EARLY_EXIT else None
+    for event in iter_video_events(path, hop, early_exit, faces):
+        track_video_event(info, event)
+        if progress is not None:
+            progress(frames_decoded=info["frames_sampled"], windows_scored=len(info["scores"]))
+    return info
+
+def face_scope(faces):
+    """
+    What a full-video result with FACE_CROP was scored on: "main_face" (the
+    crops of one face, see iter_face_crops; unlike single-window mode there is
+    no per-track "faces" list) or "whole_frames" when no face was found.
+    """
+    return "main_face" if faces.track_count else "whole_frames"
+
+def full_video_result(info, aggregate=WINDOW_AGGREGATE):
+    if info["frames_sampled"] == 0 or len(info["scores"]) == 0:
+        raise ValueError("could not decode any frames")
+    prob = aggregate_scores(info["scores"], aggregate)
+    return {
+        "probability": prob,
+        "is_fake": bool(prob >= THRESHOLD),
+        "aggregate": aggregate,
+        "frames_sampled": info["frames_sampled"],
+        "frames_planned": info["frames_planned"],
+        "frames_reused": info["frames_reused"],
+        "early_exit": info["early_exit"],
+        "window_scores": info["scores"],
+    }
+
+class LiveScorer:
+    """
+    Incremental scoring of an endless frame stream. Per-frame LSTM inputs
+    (CNN features, or the frames themselves for a 5-D LSTM) live in a ring
+    buffer of the last seq_len frames, so every frame goes through
+    feat_extractor exactly once; push() returns a window score every
+    `every` frames once the buffer is full, and None otherwise.
+    """
+
+    def __init__(self, seq_len=SEQ_LEN, every=LIVE_SCORE_EVERY):
+        self.seq_len = seq_len
+        self.every = max(1, int(every))
+        self.dedup = FrameDeduplicator() if DEDUP_FRAMES else None
+        self.ring = None
+        self.frames = 0
+
+    def push(self, frame):
+        chunk = preprocess_frame(frame)[np.newaxis]
+        item = next(iter_feature_chunks([chunk], self.dedup))[0]
+        if self.ring is None:
+            self.ring = np.empty((self.seq_len,) + item.shape, dtype=item.dtype)
+        self.ring[self.frames % self.seq_len] = item
+        self.frames += 1
+        if self.frames < self.seq_len or (self.frames - self.seq_len) % self.every:
+            return None
+        # Oldest first: the slot after the newest item starts the window
+        window = np.roll(self.ring, -(self.frames % self.seq_len), axis=0)
+        return float(np.array(lstm_fn(window[np.newaxis])).reshape(-1)[0])
+
+def iter_live_frames(source, max_frames=None):
+    cap = cv2.VideoCapture(source)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"could not open live source {source!r}")
+        n = 0
+        while max_frames is None or n < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            n += 1
+            yield frame
+    finally:
+        cap.release()
+
+def iter_live_scores(source, every=LIVE_SCORE_EVERY, max_frames=None, realtime=None):
+    """
+    Score a cv2.VideoCapture source (device index, file, pipe or stream URL)
+    as it plays, yielding {"frame", "frames_dropped", "probability",
+    "is_fake"} every `every` scored frames. Capture runs on a producer
+    thread; closing the generator releases the source. With `realtime`
+    (the default for anything but a regular file), frames captured while the
+    models were busy are dropped and scoring resumes from the newest one, so
+    scores track the live feed; files have every frame scored.
+    """
+    if realtime is None:
+        realtime = not (isinstance(source, str) and os.path.isfile(source))
+    scorer = LiveScorer(every=every)
+    stats = {"dropped": 0}
+    frames = prefetch(iter_live_frames(source, max_frames), latest_only=realtime, stats=stats)
+    try:
+        for frame in frames:
+            prob = scorer.push(frame)
+            if prob is not None:
+                yield {"frame": scorer.frames, "frames_dropped": stats["dropped"],
+                       "probability": prob, "is_fake": bool(prob >= THRESHOLD)}
+    finally:
+        frames.close()
+
+# Results are keyed by upload hash + model version + everything in the config
+# that changes a verdict, so a config or model change never serves stale results
+prediction_cache = PredictionCache(PREDICTION_CACHE_PATH, {
+    "app": "deep_fake_main",
+    "models": file_fingerprint(CNN_MODEL_PATH, LSTM_MODEL_PATH),
+    "seq_len": SEQ_LEN,
+    "frame_stride": FRAME_STRIDE,
+    "img_size": IMG_SIZE,
+    "preprocessing": PREPROCESSING_VERSION,
+    "threshold": THRESHOLD,
+    "sampling": [SAMPLING_STRATEGY, KEYFRAME_INTERVAL_SEC, SCENE_PROBES, SCENE_CUT_THRESHOLD],
+    "full_video": [FULL_VIDEO_STRIDE, MAX_FULL_VIDEO_FRAMES, WINDOW_HOP, WINDOW_TOP_K],
+    "dedup": [DEDUP_FRAMES, DEDUP_MAX_HAMMING, DEDUP_MAX_COLOR_DELTA],
+    "early_exit": [EARLY_EXIT, EARLY_EXIT_MARGIN, EARLY_EXIT_PATIENCE, EARLY_EXIT_Z, EARLY_EXIT_MIN_WINDOWS],
+    "faces": [face_detector is not None, FACE_DETECTOR_MODEL, FACE_DETECT_EVERY, FACE_MAX_DETECTIONS, FACE_MARGIN, FACE_MAX_TRACKS,
+              FACE_MIN_TRACK_FRAMES],
+}, max_items=PREDICTION_CACHE_ITEMS)
+single_flight = SingleFlight(SINGLE_FLIGHT_LOCK_DIR)
+
+NEAR_DUP_IMAGE, NEAR_DUP_VIDEO = 1, 2   # verdict kinds stored in the index
+near_dup_index = None
+if NEAR_DUP_INDEX_DIR:
+    near_dup_index = EmbeddingIndex(
+        NEAR_DUP_INDEX_DIR, int(np.prod(feat_extractor.output_shape[1:])),
+        capacity=NEAR_DUP_CAPACITY, threshold=NEAR_DUP_THRESHOLD,
+        namespace=prediction_cache.namespace + "|video_key=window_mean")
+
+def near_dup_key(feats):
+    """
+    Index key for the (N, D) CNN features of the frames that get scored: the
+    mean of their L2-normalised rows. Its cosine similarity to another key is
+    high only when all N frames look alike, so two videos that merely share an
+    opening title card or logo do not match.
+    """
+    norms = np.linalg.norm(feats, axis=1, keepdims=True)
+    return (feats / np.maximum(norms, 1e-12)).mean(axis=0, keepdims=True)
+
+def score_with_near_dup(frames, kind, score):
+    """
+    Return the stored verdict of a near-duplicate of `frames` (the
+    preprocessed frames that are scored: the image, or the sampled window of
+    a video) if the index has one; otherwise run `score(feats)` and add the
+    result. `feats` are the frames' (N, D) CNN features, or None when the
+    index is disabled and nothing has been computed.
+    """
+    if near_dup_index is None:
+        prob = score(None)
+        return {"probability": prob, "is_fake": bool(prob >= THRESHOLD)}
+
+    feats = feature_fn(frames).reshape((len(frames), -1))
+    key = near_dup_key(feats)
+    match = near_dup_index.query(key, kind)
+    if match is not None:
+        prob, similarity = match
+        return {"probability": prob, "is_fake": bool(prob >= THRESHOLD),
+                "near_duplicate_similarity": similarity}
+    prob = score(feats)
+    near_dup_index.add(key, prob, kind)
+    return {"probability": prob, "is_fake": bool(prob >= THRESHOLD)}
+
+def decode_image(source):
+    """
+    BGR image from the uploaded bytes (or a path). Large JPEGs are decoded at
+    the smallest 1/2-1/8 scale that still covers IMG_SIZE, unless face crops
+    need the full resolution.
+    """
+    if not isinstance(source, (bytes, bytearray, memoryview)):
+        with open(source, "rb") as f:
+            source = f.read()
+    return decode_image_cv2(source, None if FACE_CROP else (IMG_SIZE[1], IMG_SIZE[0]))
+
+def predict_file(path, mime, mode="single", aggregate=WINDOW_AGGREGATE, progress=None):
+    """
+    Score an uploaded file by path (images may also be passed as their bytes).
+    Raises ValueError for undecodable input. With FACE_CROP the result also
+    reports how many face detector runs it took, and either a per-face
+    "faces" list (images, single-window videos) or the full-video
+    "face_scope".
+    """
+    faces = new_face_tracker()
+    details = {}
+
+    def score_faces(frames, whole, min_frames=1):
+        # Every face track gets its own probability; without faces, fall back to `whole()`
+        crops, tracks = collect_face_tracks(frames, faces, min_frames)
+        if not tracks:
+            return whole()
+        prob, details["faces"] = face_track_result(score_face_tracks(crops, tracks), tracks)
+        return prob
+
+    if mime.startswith("image/"):
+        img = decode_image(path)
+        if img is None:
+            raise ValueError("could not decode image")
+        frame = preprocess_frame(img)
+        if faces is None:
+            score = lambda feats: predict_from_image(frame, feats)
+        else:
+            score = lambda feats: score_faces([img], lambda: predict_from_image(frame, feats))
+        result = score_with_near_dup(frame[np.newaxis], NEAR_DUP_IMAGE, score)
+    elif mode == "full":
+        result = full_video_result(score_video(path, progress=progress, faces=faces, aggregate=aggregate),
+                                   aggregate)
+        if faces is not None:
+            result["face_scope"] = face_scope(faces)
     else:
-        feats = feat_extractor.predict(frames_b, verbose=0)
-        if len(feats.shape) > 2:
-            feats = feats.reshape((feats.shape[0], -1))
-        seq = np.expand_dims(feats, axis=0)  # (1, SEQ_LEN, feature_dim)
-        lstm_out = lstm.predict(seq, verbose=0)
+        frames, n = extract_frames_from_video(path, seq_len=SEQ_LEN)
+        if n == 0:
+            raise ValueError("could not decode any frames")
+        if faces is None:
+            score = lambda feats: predict_from_frames(frames, feats)
+        else:
+            faces.plan(SEQ_LEN)
+            score = lambda feats: score_faces(iter_sampled_frames(path, seq_len=SEQ_LEN),
+                                              lambda: predict_from_frames(frames, feats),
+                                              FACE_MIN_TRACK_FRAMES)
+        # Keyed on the whole sampled window, not just the opening frame
+        result = score_with_near_dup(frames, NEAR_DUP_VIDEO, score)
+        if progress is not None:
+            progress(frames_decoded=SEQ_LEN, windows_scored=1)
+    result.update(details)
+    if faces is not None:
+        result["face_detector_runs"] = faces.detector_runs
+    return result
+
+def request_options(f):
+    """Options that change the result of scoring upload `f`; part of its cache key."""
+    if (f.mimetype or "").startswith("image/"):
+        return ("image",)
+    return ("video", request.form.get("mode", "single"),
+            request.form.get("aggregate", WINDOW_AGGREGATE))
+
+# Job status lives next to the cached verdicts, so any worker can answer GET /jobs/<id>
+job_manager = JobManager(PREDICTION_CACHE_PATH, workers=JOB_WORKERS, ttl=JOB_RESULT_TTL_SEC, max_pending=JOB_MAX_PENDING)
+os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+
+def run_job(progress, path, mime, options, cache_key):
+    def compute():
+        result = predict_file(path, mime, *options[1:], progress=progress)
+        prediction_cache.put(cache_key, result)
+        return result
+    return single_flight.do(cache_key, compute, lookup=lambda: prediction_cache.get(cache_key))
+
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_DECODE_WORKERS)
+
+def decode_into(data, out):
+    """Decode + preprocess image bytes into `out` (a row of a batch); False if undecodable."""
+    img = decode_image(data)
+    if img is None:
+        return False
+    preprocess_frame(img, out=out)
+    return True
+
+def predict_bytes(data, mime, name):
+    """predict_file for an in-memory upload; videos go through an UploadFile."""
+    if mime.startswith("image/"):
+        return predict_file(data, mime)
+    with UploadFile(io.BytesIO(data), os.path.splitext(name)[1], UPLOAD_MEMORY_LIMIT) as upload:
+        return predict_file(upload.path, mime)
+
+def predict_image_batch(frames):
+    """
+    Score a uint8 (N, H, W, 3) batch of preprocessed images the way
+    predict_file scores one (near-duplicate index included), with one
+    feat_extractor call for the whole batch and one LSTM call over the
+    tiled SEQ_LEN sequences of the images that still need scoring.
+    """
+    feats = None
+    if near_dup_index is not None or len(lstm.input_shape) != 5:
+        feats = feature_fn(frames).reshape((len(frames), -1))
+    results = [None] * len(frames)
+    todo = []
+    for i in range(len(frames)):
+        match = near_dup_index.query(near_dup_key(feats[i:i + 1]), NEAR_DUP_IMAGE) if near_dup_index is not None else None
+        if match is None:
+            todo.append(i)
+            continue
+        prob, similarity = match
+        results[i] = {"probability": prob, "is_fake": bool(prob >= THRESHOLD),
+                      "near_duplicate_similarity": similarity}
+    if todo:
+        items = frames[todo] if len(lstm.input_shape) == 5 else feats[todo]
+        probs = np.array(lstm_fn(np.repeat(items[:, np.newaxis], SEQ_LEN, axis=1))).reshape(-1)
+        for i, prob in zip(todo, probs.astype(float).tolist()):
+            if near_dup_index is not None:
+                near_dup_index.add(near_dup_key(feats[i:i + 1]), prob, NEAR_DUP_IMAGE)
+            results[i] = {"probability": prob, "is_fake": bool(prob >= THRESHOLD)}
+    return results
+
+def score_batch_group(group):
+    """
+    Results for a list of (name, mime, bytes) in order. Cached files are
+    answered from the cache; images are decoded on batch_pool straight into
+    one preallocated batch and scored together; videos (and face-cropped
+    images) run predict_file on batch_pool concurrently.
+    """
+    results = [None] * len(group)
+    keys = [None] * len(group)
+    images = []   # (position, future)
+    others = []
+    image_batch = np.empty((len(group), IMG_SIZE[0], IMG_SIZE[1], 3), dtype=np.uint8)
+    for i, (name, mime, data) in enumerate(group):
+        if not mime.startswith(("image/", "video/")):
+            results[i] = {"error": "unsupported file type"}
+            continue
+        options = ("image",) if mime.startswith("image/") else ("video", "single", WINDOW_AGGREGATE)
+        keys[i] = prediction_cache.key(content_hash(data), *options)
+        cached = prediction_cache.get(keys[i])
+        if cached is not None:
+            results[i] = cached
+        elif options[0] == "image" and not FACE_CROP:
+            images.append((i, batch_pool.submit(decode_into, data, image_batch[len(images)])))
+        else:
+            others.append((i, batch_pool.submit(predict_bytes, data, mime, name)))
 
-    out_arr = np.array(lstm_out).reshape(-1)
-    prob = float(out_arr[0])
-    return prob
+    rows = []
+    for row, (i, future) in enumerate(images):
+        if future.result():
+            rows.append((row, i))
+        else:
+            results[i] = {"error": "could not decode image"}
+    if rows:
+        batch = image_batch[[row for row, _ in rows]]
+        for (_, i), result in zip(rows, predict_image_batch(batch)):
+            prediction_cache.put(keys[i], result)
+            results[i] = result
+    for i, future in others:
+        try:
+            results[i] = future.result()
+            prediction_cache.put(keys[i], results[i])
+        except Exception as e:
+            results[i] = {"error": str(e)}
+    return results
 
 # ---------------- HTML ----------------
 INDEX_HTML = """<!doctype html>
@@ -734,6 +1820,7 @@ h1 {
           <div class="spinner"></div>
           <p>Analyzing media with AI algorithms...</p>
           <p style="font-size: 0.9rem; color: #666; margin-top: 10px;">This may take a few moments</p>
+          <p id="loadingProgress" style="font-size: 0.9rem; color: #667eea; margin-top: 10px;"></p>
         </div>
 
         <div class="result" id="result">
@@ -853,6 +1940,7 @@ h1 {
         this.fileSize = document.getElementById('fileSize');
         this.analyzeButton = document.getElementById('analyzeButton');
         this.loading = document.getElementById('loading');
+        this.loadingProgress = document.getElementById('loadingProgress');
         this.result = document.getElementById('result');
         this.resultIcon = document.getElementById('resultIcon');
         this.resultLabel = document.getElementById('resultLabel');
@@ -1038,8 +2126,8 @@ h1 {
           const formData = new FormData();
           formData.append('file', this.fileInput.files[0]);
 
-          // Simulate API call (replace with actual endpoint)
-          const response = await this.simulateAnalysis(formData);
+          // Partial results are rendered as the server streams them
+          const response = await this.analyzeStream(formData);
           
           this.displayResults(response);
         } catch (error) {
@@ -1051,24 +2139,65 @@ h1 {
         }
       }
 
-      // Simulate analysis since we don't have a real backend
-      async simulateAnalysis(formData) {
-        return new Promise((resolve) => {
-          setTimeout(() => {
-            const isFake = Math.random() > 0.6;
-            const probability = isFake ? 0.7 + Math.random() * 0.25 : Math.random() * 0.4;
-            
-            resolve({
-              is_fake: isFake,
-              probability: probability,
-              confidence: probability > 0.8 ? 'High' : probability > 0.6 ? 'Medium' : 'Low'
-            });
-          }, 2000 + Math.random() * 3000);
-        });
+      // Read the Server-Sent Events stream from /predict/stream,
+      // rendering progress events until the final result arrives
+      async analyzeStream(formData) {
+        const response = await fetch('/predict/stream', { method: 'POST', body: formData });
+        if (!response.ok || !response.body) {
+          throw new Error(`Request failed with status ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+
+        while (true) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+
+          let boundary;
+          while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+            const message = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const data = message.split('\\n')
+              .filter(line => line.startsWith('data:'))
+              .map(line => line.slice(5).trim())
+              .join('\\n');
+            if (!data) continue;
+
+            const event = JSON.parse(data);
+            if (event.event === 'error') throw new Error(event.error);
+            if (event.event === 'result') {
+              result = event;
+            } else {
+              this.displayProgress(event);
+            }
+          }
+        }
+
+        if (!result) throw new Error('Stream ended without a result');
+        return result;
+      }
+
+      displayProgress(event) {
+        if (!this.loadingProgress) return;
+        let text = `Frames analyzed: ${event.frames_decoded}`;
+        if (event.windows_scored) {
+          text += ` • Segments scored: ${event.windows_scored}`;
+          text += ` • Running fake probability: ${(event.probability * 100).toFixed(1)}%`;
+        }
+        this.loadingProgress.textContent = text;
+      }
+
+      confidenceLabel(probability) {
+        return probability > 0.8 ? 'High' : probability > 0.6 ? 'Medium' : 'Low';
       }
 
       showLoading() {
         if (this.loading) this.loading.style.display = 'block';
+        if (this.loadingProgress) this.loadingProgress.textContent = '';
         if (this.result) this.result.style.display = 'none';
       }
 
@@ -1083,7 +2212,7 @@ h1 {
         
         const isFake = response.is_fake;
         const probability = response.probability;
-        const confidence = response.confidence;
+        const confidence = response.confidence || this.confidenceLabel(isFake ? probability : (1 - probability));
 
         if (isFake) {
           this.result.classList.add('fake');
@@ -1100,6 +2229,10 @@ h1 {
             this.resultDescription.textContent = 'This media appears to be authentic with no signs of AI manipulation detected.';
           }
         }
+        if (this.resultDescription && response.face_scope === 'main_face') {
+          // Full-video scoring follows one face; other people in the video were not analyzed
+          this.resultDescription.textContent += ' Only the most prominent face in the video was analyzed.';
+        }
 
         if (this.probabilityFill) {
           const displayProbability = isFake ? probability : (1 - probability);
@@ -1170,25 +2303,200 @@ def predict():
     if 'file' not in request.files:
         return jsonify({"error": "no file uploaded"}), 400
     f = request.files['file']
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(f.filename)[1]) as tmp:
-        f.save(tmp.name)
-        tmp_path = tmp.name
-    try:
-        mime = f.mimetype or ""
-        if mime.startswith("image/"):
-            img = cv2.imread(tmp_path)
-            frame = preprocess_frame(img)
-            frames = np.stack([frame]*SEQ_LEN, axis=0)
+    mime = f.mimetype or ""
+    options = request_options(f)
+    # Cache hits skip decoding and TensorFlow entirely
+    cache_key = prediction_cache.key(content_hash(f.stream), *options)
+    cached = prediction_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached)
+
+    def compute():
+        if options[0] == "image":
+            result = predict_file(f.read(), mime)
         else:
-            frames = extract_frames_from_video(tmp_path, seq_len=SEQ_LEN)
+            with UploadFile(f.stream, os.path.splitext(f.filename)[1], UPLOAD_MEMORY_LIMIT) as upload:
+                result = predict_file(upload.path, mime, *options[1:])
+        prediction_cache.put(cache_key, result)
+        return result
 
-        prob = predict_from_frames(frames)
-        is_fake = bool(prob >= THRESHOLD)
-        return jsonify({"probability": prob, "is_fake": is_fake})
+    try:
+        # Concurrent duplicates of this upload wait here for the first one's result
+        result = single_flight.do(cache_key, compute, lookup=lambda: prediction_cache.get(cache_key))
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        os.remove(tmp_path)
+
+def sse(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.route("/predict/stream", methods=["POST"])
+def predict_stream():
+    """
+    Server-Sent Events variant of /predict for long videos: one event per
+    featurized frame chunk and per scored window batch, each carrying the
+    running aggregate, then a final "result" (or "error") event. Videos are
+    always scored over the whole clip, so with FACE_CROP only their main
+    face is scored ("face_scope"; per-face results need /predict's
+    single-window mode). If the client disconnects the generator is closed,
+    which stops decoding and inference.
+    """
+    if 'file' not in request.files:
+        return jsonify({"error": "no file uploaded"}), 400
+    f = request.files['file']
+    mime = f.mimetype or ""
+    aggregate = request.form.get("aggregate", WINDOW_AGGREGATE)
+    options = ("image",) if mime.startswith("image/") else ("video", "full", aggregate)
+    cache_key = prediction_cache.key(content_hash(f.stream), *options)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    cached = prediction_cache.get(cache_key)
+    if cached is not None:
+        return Response(sse(dict(cached, event="result")), mimetype="text/event-stream", headers=headers)
+
+    if options[0] == "image":
+        data, upload = f.read(), None
+    else:
+        upload = UploadFile(f.stream, os.path.splitext(f.filename)[1], UPLOAD_MEMORY_LIMIT)
+
+    def events():
+        video_events = None
+        try:
+            if upload is None:
+                result = predict_file(data, mime)
+            else:
+                info = new_video_info()
+                faces = new_face_tracker()
+                video_events = iter_video_events(upload.path, early_exit=EarlyExitPolicy(aggregate) if EARLY_EXIT else None,
+                                                 faces=faces)
+                for event in video_events:
+                    track_video_event(info, event)
+                    payload = {k: v for k, v in event.items() if k != "scores"}
+                    if event["event"] == "windows":
+                        payload["window_scores"] = [float(x) for x in event["scores"]]
+                    if info["scores"]:
+                        payload["windows_scored"] = len(info["scores"])
+                        payload["probability"] = aggregate_scores(info["scores"], aggregate)
+                    yield sse(payload)
+                result = full_video_result(info, aggregate)
+                if faces is not None:
+                    result["face_detector_runs"] = faces.detector_runs
+                    result["face_scope"] = face_scope(faces)
+            prediction_cache.put(cache_key, result)
+            yield sse(dict(result, event="result"))
+        except Exception as e:
+            yield sse({"event": "error", "error": str(e)})
+        finally:
+            if video_events is not None:
+                video_events.close()
+            if upload is not None:
+                upload.close()
+
+    response = Response(events(), mimetype="text/event-stream", headers=headers)
+    if upload is not None:
+        # A generator that never started never runs its finally: if the client
+        # is gone before the first event, only the response close frees the fd
+        response.call_on_close(upload.close)
+    return response
+
+@app.route("/predict/batch", methods=["POST"])
+def predict_batch():
+    """
+    Score many files in one request: any number of multipart file parts
+    and/or zip/tar archives of them. Results stream back as JSON Lines, one
+    object per file ("index", "name", then the /predict fields or "error");
+    a request-level problem (an exceeded limit, an unreadable archive) ends
+    the stream with an {"error": ...} line after the results for the files
+    read before it. Videos are scored in single-window mode.
+    """
+    # Werkzeug closes the uploads when this view returns, before the
+    # response body is generated, so take the (in-memory) bytes now
+    parts = [(f.filename, f.mimetype, io.BytesIO(f.read())) for _, f in request.files.items(multi=True)]
+    if not parts:
+        return jsonify({"error": "no file uploaded"}), 400
+
+    def lines():
+        try:
+            for result in iter_batch_results(parts, score_batch_group, BATCH_GROUP,
+                                             max_items=BATCH_MAX_ITEMS, max_item_bytes=BATCH_MAX_ITEM_BYTES,
+                                             max_total_bytes=BATCH_MAX_TOTAL_BYTES):
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return Response(lines(), mimetype="application/x-ndjson")
+
+@app.route("/live/<name>", methods=["GET"])
+def live_stream(name):
+    """
+    Server-Sent Events with a "score" event every `?every=` frames of the
+    LIVE_SOURCES capture called `name`, until it ends ("end") or the client
+    disconnects, which releases the capture.
+    """
+    if name not in LIVE_SOURCES:
+        return jsonify({"error": "unknown live source"}), 404
+    every = request.args.get("every", LIVE_SCORE_EVERY, type=int)
+
+    def events():
+        scores = iter_live_scores(LIVE_SOURCES[name], every)
+        try:
+            for score in scores:
+                yield sse(dict(score, event="score"))
+            yield sse({"event": "end"})
+        except Exception as e:
+            yield sse({"event": "error", "error": str(e)})
+        finally:
+            scores.close()
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    """Store the upload and score it in the background; poll GET /jobs/<id>."""
+    if 'file' not in request.files:
+        return jsonify({"error": "no file uploaded"}), 400
+    f = request.files['file']
+    mime = f.mimetype or ""
+    options = request_options(f)
+    cache_key = prediction_cache.key(content_hash(f.stream), *options)
+
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(f.filename)[1], dir=JOB_UPLOAD_DIR)
+    with os.fdopen(fd, "wb") as out:
+        f.save(out)
+    try:
+        job_id = job_manager.submit(run_job, path, mime, options, cache_key,
+                                    cleanup=lambda: os.remove(path))
+    except JobQueueFull as e:
+        os.remove(path)
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "unknown or expired job"}), 404
+    return jsonify(job)
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Deepfake detector web app, or live scoring with --live")
+    parser.add_argument("--live", metavar="SOURCE",
+                        help="score a video device index, file or pipe continuously instead of serving")
+    parser.add_argument("--every", type=int, default=LIVE_SCORE_EVERY, help="frames between window scores")
+    parser.add_argument("--max-frames", type=int, default=None, help="stop after this many frames")
+    args = parser.parse_args()
+
+    if args.live is None:
+        app.run(debug=True)
+    else:
+        source = int(args.live) if args.live.isdigit() else args.live
+        try:
+            for score in iter_live_scores(source, args.every, args.max_frames):
+                label = "FAKE" if score["is_fake"] else "real"
+                print(f"frame {score['frame']:>6}  {score['probability']:.4f}  {label}", flush=True)
+        except KeyboardInterrupt:
+            pass
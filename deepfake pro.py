@@ -1,22 +1,60 @@
 import tensorflow as tf
 from tensorflow.keras.models import load_model
-from flask import Flask, request, jsonify, render_template_string, redirect, url_for, session
-from PIL import Image
+from flask import Flask, Response, request, jsonify, render_template_string, redirect, url_for, session
 import numpy as np
 import io
+import json
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from prediction_cache import PredictionCache, SingleFlight, content_hash, file_fingerprint
+from preprocessing import PREPROCESSING_VERSION, open_image, preprocess_batch, to_rgb_float
+from serving import BucketedModel, MicroBatcher
+from uploads import InMemoryUploadRequest, iter_batch_results
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'  # Change this to a secure secret key
+# Keep uploaded images in memory instead of werkzeug's >500 KB temp-file spooling
+app.request_class = InMemoryUploadRequest
+
+MODEL_PATH = 'deepfake_detector_model4.h5'
+INPUT_SIZE = (128, 128)  # (width, height) the model was trained on
+# Cross-request micro-batching: concurrent requests' model calls are merged
+BATCH_MAX_SIZE = 32      # rows per merged call
+BATCH_MAX_WAIT_MS = 5    # how long the first request waits for company
+# /predict/batch limits (after decompressing archives) and batching
+BATCH_MAX_ITEMS = 500
+BATCH_MAX_ITEM_BYTES = 32 * 1024 * 1024
+BATCH_MAX_TOTAL_BYTES = 1024 * 1024 * 1024
+BATCH_GROUP = 32  # images decoded concurrently and scored in one model call
 
 # Load the pre-trained model
 try:
-    model = load_model('deepfake_detector_model4.h5')
+    model = load_model(MODEL_PATH)
     print("Model loaded successfully!")
 except Exception as e:
     print(f"Error loading model: {e}")
     model = None
 
+# Traced once per batch-size bucket so requests never go through model.predict(),
+# and micro-batched so concurrent requests share one call (at most BATCH_MAX_WAIT_MS extra wait)
+model_fn = (MicroBatcher(BucketedModel(model), max_batch=BATCH_MAX_SIZE, max_wait=BATCH_MAX_WAIT_MS / 1000.0)
+            if model is not None else None)
+
+# Content-addressed result cache (in-memory LRU + SQLite shared across workers),
+# namespaced by model version and preprocessing config
+prediction_cache = PredictionCache('prediction_cache.sqlite3', {
+    'app': 'deepfake_pro',
+    'model': file_fingerprint(MODEL_PATH),
+    'input_size': list(INPUT_SIZE),
+    'preprocessing': PREPROCESSING_VERSION,
+    'threshold': 0.7,
+})
+# Identical concurrent uploads (in this process or other workers on the host)
+# wait for one computation instead of each running the model
+single_flight = SingleFlight(os.path.join(tempfile.gettempdir(), 'deepfake_detector_locks'))
+
 # Simple user database (replace with actual database in production)
 users = {
     'demo@example.com': 'password123',
@@ -26,18 +64,81 @@ users = {
 
 def preprocess_image(image):
     """
-    Preprocess the uploaded image to match the model's input requirements.
+    Preprocess the uploaded image to match the model's input requirements:
+    RGB, 128x128, float32 in [0, 1], with a batch dimension.
+    """
+    return to_rgb_float(image, INPUT_SIZE)[np.newaxis]
+
+
+def preprocess_images(images):
+    """Preprocess several images into one contiguous float32 model batch."""
+    return preprocess_batch(images, INPUT_SIZE)
+
+
+def predict_image_bytes(data):
+    """Run the model on raw uploaded image bytes and build the JSON result."""
+    # Open image using PIL; large JPEGs decode at reduced scale (still >= 128x128)
+    image = open_image(data, INPUT_SIZE)
+
+    # Preprocess the image
+    image_array = preprocess_image(image)
+
+    # Make prediction
+    prediction = model_fn(image_array)[0][0]
+    return prediction_result(prediction)
+
+
+def prediction_result(prediction):
+    """JSON result for one model output."""
+    is_deepfake = prediction > 0.7  # 70% threshold
+
+    return {
+        'prediction': float(prediction),
+        'is_deepfake': bool(is_deepfake),
+        'threshold': 0.7
+    }
+
+
+# Batch uploads are decoded here, several images at a time
+decode_pool = ThreadPoolExecutor(max_workers=4)
+
+
+def decode_image_bytes(data):
+    """Fully decode uploaded bytes to a PIL image on the calling thread (None if undecodable)."""
+    try:
+        image = open_image(data, INPUT_SIZE)
+        image.load()
+        return image
+    except Exception:
+        return None
+
+
+def predict_image_group(group):
+    """
+    Results for a list of (name, mimetype, bytes): cached images come from the
+    cache, the rest are decoded on decode_pool and scored in one model call.
     """
-    # Resize image to 128x128 to match model input
-    image = image.resize((128, 128))
-    # Convert to RGB if not already
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
-    # Convert to numpy array and normalize pixel values to [0, 1]
-    image_array = np.array(image) / 255.0
-    # Add batch dimension for model input
-    image_array = np.expand_dims(image_array, axis=0)
-    return image_array
+    results = [None] * len(group)
+    keys = [prediction_cache.key(content_hash(data)) for _, _, data in group]
+    pending = []
+    for i, (_, _, data) in enumerate(group):
+        results[i] = prediction_cache.get(keys[i])
+        if results[i] is None:
+            pending.append((i, decode_pool.submit(decode_image_bytes, data)))
+
+    decoded = []
+    for i, future in pending:
+        image = future.result()
+        if image is None:
+            results[i] = {'error': 'Could not decode image'}
+        else:
+            decoded.append((i, image))
+    if decoded:
+        predictions = model_fn(preprocess_images([image for _, image in decoded]))
+        for (i, _), prediction in zip(decoded, predictions[:, 0]):
+            results[i] = prediction_result(prediction)
+            prediction_cache.put(keys[i], results[i])
+    return results
 
 
 # HTML Templates
@@ -664,27 +765,56 @@ def predict():
         if file.filename == '':
             return jsonify({'error': 'No image selected'}), 400
 
-        # Open image using PIL
-        image = Image.open(io.BytesIO(file.read()))
-
-        # Preprocess the image
-        image_array = preprocess_image(image)
+        data = file.read()
+        cache_key = prediction_cache.key(content_hash(data))
+        cached = prediction_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
 
-        # Make prediction
-        prediction = model.predict(image_array)[0][0]
-        is_deepfake = prediction > 0.7  # 70% threshold
+        def compute():
+            result = predict_image_bytes(data)
+            prediction_cache.put(cache_key, result)
+            return result
 
-        # Return JSON response
-        return jsonify({
-            'prediction': float(prediction),
-            'is_deepfake': bool(is_deepfake),
-            'threshold': 0.7
-        })
+        # Concurrent duplicates of this upload wait here for the first one's result
+        result = single_flight.do(cache_key, compute, lookup=lambda: prediction_cache.get(cache_key))
+        return jsonify(result)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Score many images in one request: any number of multipart file parts
+    and/or zip/tar archives of images. Results stream back as JSON Lines,
+    one object per image ('index', 'name', then the /predict fields or
+    'error'); a request-level problem ends the stream with an 'error' line.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Please log in to use the detector'}), 401
+
+    if model is None:
+        return jsonify({'error': 'Model not loaded'}), 500
+
+    # The uploads are closed when this view returns, so take the bytes now
+    parts = [(f.filename, f.mimetype, io.BytesIO(f.read())) for _, f in request.files.items(multi=True)]
+    if not parts:
+        return jsonify({'error': 'No image provided'}), 400
+
+    def lines():
+        try:
+            for result in iter_batch_results(parts, predict_image_group, BATCH_GROUP,
+                                             max_items=BATCH_MAX_ITEMS, max_item_bytes=BATCH_MAX_ITEM_BYTES,
+                                             max_total_bytes=BATCH_MAX_TOTAL_BYTES):
+                yield json.dumps(result) + '\n'
+        except Exception as e:
+            yield json.dumps({'error': str(e)}) + '\n'
+
+    return Response(lines(), mimetype='application/x-ndjson')
+
+
 if __name__ == '__main__':
     # Set session permanent lifetime
     from datetime import timedelta
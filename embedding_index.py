@@ -0,0 +1,145 @@
+# embedding_index.py
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from prediction_cache import file_lock
+
+
+class EmbeddingIndex:
+    """
+    Approximate nearest-neighbour index over CNN embeddings, used to recognise
+    re-encoded / recompressed / lightly cropped copies of media that was
+    already scored and return the stored verdict instead of running inference.
+
+    Vectors are L2-normalised and bucketed by random-hyperplane LSH codes; a
+    query scans only the uint32 code column, probes its own bucket plus every
+    bucket one bit away, and computes exact cosine similarity on those
+    candidates. Everything lives in .npy files that are opened memory-mapped,
+    so every worker shares one on-disk index. Inserts are incremental; once
+    `capacity` entries exist the oldest are overwritten.
+
+    Each dimension/capacity/hashing/`namespace` (e.g. the model version)
+    combination gets its own subdirectory of `path`, named by a hash of it,
+    so files are never reset in place: during a rolling update, workers on
+    the old and new model keep separate indexes instead of reading each
+    other's verdicts (or truncating files another process has mapped).
+    """
+
+    def __init__(self, path, dim, capacity=100000, n_bits=12, threshold=0.995,
+                 namespace="", seed=0):
+        self.path = path
+        self.dim = int(dim)
+        self.capacity = int(capacity)
+        self.n_bits = int(n_bits)
+        self.threshold = float(threshold)
+        self.namespace = str(namespace)
+        self._planes = np.random.default_rng(seed).standard_normal((self.n_bits, self.dim)).astype(np.float32)
+        self._bits = (1 << np.arange(self.n_bits)).astype(np.uint32)
+        self._lock = threading.Lock()
+        self._meta_mtime = None
+        layout = json.dumps(self._layout(), sort_keys=True)
+        self.dir = os.path.join(path, hashlib.sha256(layout.encode()).hexdigest()[:16])
+        os.makedirs(self.dir, exist_ok=True)
+        with file_lock(self._file("index.lock")):
+            self._open()
+
+    def _file(self, name):
+        return os.path.join(self.dir, name)
+
+    def _layout(self):
+        return {"dim": self.dim, "capacity": self.capacity, "n_bits": self.n_bits,
+                "namespace": self.namespace}
+
+    def _matches(self, meta):
+        return meta is not None and all(meta.get(k) == v for k, v in self._layout().items())
+
+    def _open(self):
+        meta = self._read_meta()
+        mode = "r+"
+        if meta is None:
+            meta = dict(self._layout(), count=0, next=0)
+            mode = "w+"
+        elif not self._matches(meta):
+            raise ValueError(f"embedding index {self.dir} holds a different layout")
+        open_memmap = np.lib.format.open_memmap
+        self._vectors = open_memmap(self._file("vectors.npy"), mode, np.float32, (self.capacity, self.dim))
+        self._codes = open_memmap(self._file("codes.npy"), mode, np.uint32, (self.capacity,))
+        self._scores = open_memmap(self._file("scores.npy"), mode, np.float32, (self.capacity,))
+        self._tags = open_memmap(self._file("tags.npy"), mode, np.uint8, (self.capacity,))
+        if mode == "w+":
+            self._write_meta(meta)
+        self._meta = meta
+
+    def _read_meta(self):
+        try:
+            with open(self._file("meta.json")) as f:
+                meta = json.load(f)
+            self._meta_mtime = os.stat(self._file("meta.json")).st_mtime_ns
+            return meta
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, meta):
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._file("meta.json"))
+        self._meta_mtime = os.stat(self._file("meta.json")).st_mtime_ns
+
+    def _refresh(self):
+        """Pick up entries inserted by other processes since the last look."""
+        try:
+            mtime = os.stat(self._file("meta.json")).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._meta_mtime:
+            meta = self._read_meta()
+            if self._matches(meta):
+                self._meta = meta
+
+    def _normalise(self, vec):
+        vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def _code(self, unit):
+        return np.uint32(np.sum(self._bits[(self._planes @ unit) > 0]))
+
+    def query(self, vec, tag=0):
+        """Return (score, similarity) of the closest stored entry above threshold, else None."""
+        unit = self._normalise(vec)
+        code = self._code(unit)
+        probes = np.concatenate([[code], code ^ self._bits]).astype(np.uint32)
+        with self._lock:
+            self._refresh()
+            count = self._meta["count"]
+            candidates = np.flatnonzero(np.isin(self._codes[:count], probes) & (self._tags[:count] == tag))
+            if len(candidates) == 0:
+                return None
+            sims = self._vectors[candidates] @ unit
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            return float(self._scores[candidates[best]]), float(sims[best])
+
+    def add(self, vec, score, tag=0):
+        unit = self._normalise(vec)
+        with self._lock, file_lock(self._file("index.lock")):
+            meta = self._read_meta()
+            if not self._matches(meta):
+                meta = self._meta
+            slot = meta["next"]
+            self._vectors[slot] = unit
+            self._codes[slot] = self._code(unit)
+            self._scores[slot] = score
+            self._tags[slot] = tag
+            for arr in (self._vectors, self._codes, self._scores, self._tags):
+                arr.flush()
+            meta["next"] = (slot + 1) % self.capacity
+            meta["count"] = min(meta["count"] + 1, self.capacity)
+            self._write_meta(meta)
+            self._meta = meta
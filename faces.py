@@ -0,0 +1,202 @@
+# faces.py
+import os
+import threading
+
+import cv2
+import numpy as np
+
+try:
+    HAAR_FRONTAL_FACE = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+except AttributeError:  # builds without the bundled cascade files
+    HAAR_FRONTAL_FACE = None
+
+
+class FaceDetectorUnavailable(IOError):
+    pass
+
+
+class FaceDetector:
+    """
+    OpenCV face detector: YuNet (cv2.FaceDetectorYN) when given the path of
+    its ONNX `model_path`, else the Haar cascade bundled with cv2. Builds
+    differ (recent headless wheels ship FaceDetectorYN but neither
+    CascadeClassifier nor the cascade files), so a missing backend raises
+    FaceDetectorUnavailable with what to configure instead.
+    Frames are searched on a copy downscaled to at most `max_side` pixels;
+    boxes are returned in full-frame (x, y, w, h), largest first.
+    """
+
+    def __init__(self, model_path=None, cascade_path=HAAR_FRONTAL_FACE, max_side=480, min_size=24,
+                 score_threshold=0.8):
+        self.yunet = None
+        self.cascade = None
+        if model_path is not None:
+            if not hasattr(cv2, "FaceDetectorYN"):
+                raise FaceDetectorUnavailable(f"OpenCV {cv2.__version__} has no FaceDetectorYN")
+            if not os.path.isfile(model_path):
+                raise FaceDetectorUnavailable(f"face detection model {model_path} not found")
+            self.yunet = cv2.FaceDetectorYN.create(model_path, "", (max_side, max_side), score_threshold)
+        else:
+            if not hasattr(cv2, "CascadeClassifier"):
+                raise FaceDetectorUnavailable(
+                    f"OpenCV {cv2.__version__} has no CascadeClassifier; "
+                    "pass the path of a YuNet ONNX model to use cv2.FaceDetectorYN instead")
+            self.cascade = cv2.CascadeClassifier(cascade_path or "")
+            if self.cascade.empty():
+                raise FaceDetectorUnavailable(f"could not load face cascade {cascade_path}")
+        self.max_side = max_side
+        self.min_size = min_size
+        self._lock = threading.Lock()  # one detector shared by all requests
+
+    def detect(self, frame):
+        """Faces in a BGR (or grayscale) frame."""
+        scale = min(1.0, self.max_side / max(frame.shape[:2]))
+        small = frame if scale == 1.0 else cv2.resize(frame, None, fx=scale, fy=scale,
+                                                      interpolation=cv2.INTER_AREA)
+        if self.yunet is not None:
+            if small.ndim == 2:
+                small = cv2.cvtColor(small, cv2.COLOR_GRAY2BGR)
+            with self._lock:
+                self.yunet.setInputSize((small.shape[1], small.shape[0]))
+                _, found = self.yunet.detect(small)
+            boxes = [] if found is None else [f[:4] for f in found
+                                              if min(f[2], f[3]) >= self.min_size]
+        else:
+            if small.ndim == 3:
+                small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            with self._lock:
+                boxes = self.cascade.detectMultiScale(small, scaleFactor=1.1, minNeighbors=5,
+                                                      minSize=(self.min_size, self.min_size))
+        boxes = [tuple(int(round(v / scale)) for v in box) for box in boxes]
+        return sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+def crop_box(frame, box, margin=0.25):
+    """View of `frame` around `box`, grown by `margin` of its size and clipped to the frame."""
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    x0, y0 = max(0, x - dx), max(0, y - dy)
+    x1, y1 = min(frame.shape[1], x + w + dx), min(frame.shape[0], y + h + dy)
+    return frame[y0:y1, x0:x1]
+
+
+class FaceTracker:
+    """
+    Face boxes for a sequence of frames without running the detector on every
+    one: the detector runs on every `detect_every`-th frame, at most
+    `max_detections` times in total (plan() stretches the interval so the
+    runs cover the whole sequence), and boxes are followed in between by
+    normalised cross-correlation template matching (against the face as it
+    looked at its last detection) on a small grayscale search window around
+    its last position.
+
+    update(frame) returns [(track_id, box), ...] for the faces visible in that
+    frame. A track whose match score drops below `min_match` is lost, not
+    deleted: it keeps its last box until a detector run finds it again.
+    Detections are matched to visible and lost tracks by IoU, so one face
+    keeps one id for the whole sequence. Lost tracks count towards
+    `max_faces`; the oldest one makes room for a new face when it is full.
+    """
+
+    TEMPLATE_SIDE = 64  # larger faces are matched downscaled to this width
+    MIN_TEMPLATE_STD = 2.0  # flatter patches match anywhere, so they are not tracked
+
+    def __init__(self, detector, detect_every=5, max_detections=8, max_faces=4,
+                 min_match=0.5, search_margin=0.5):
+        self.detector = detector
+        self.detect_every = max(1, int(detect_every))
+        self.max_detections = max_detections
+        self.max_faces = max_faces
+        self.min_match = min_match
+        self.search_margin = search_margin
+        self.detector_runs = 0
+        self.frames = 0
+        self.track_count = 0
+        self.tracks = {}  # track_id -> [box, template, visible]
+
+    def plan(self, frame_count):
+        """Spread the detector runs over a sequence of `frame_count` frames (call before update())."""
+        if self.max_detections:
+            self.detect_every = max(self.detect_every, -(-int(frame_count) // self.max_detections))
+
+    def update(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        # Not re-run just because nothing is tracked: a video that opens
+        # without a face would spend the whole budget on its first frames
+        due = self.frames % self.detect_every == 0
+        self.frames += 1
+
+        for track in self.tracks.values():
+            if track[2]:
+                box = self._follow(gray, track[0], track[1])
+                if box is None:
+                    track[2] = False  # lost: keeps its last box
+                else:
+                    track[0] = box
+
+        if due and self.detector_runs < self.max_detections:
+            self.detector_runs += 1
+            self._merge(self.detector.detect(frame))
+            # Templates are only taken from detector boxes, so tracking
+            # error does not compound from frame to frame
+            for track in self.tracks.values():
+                if track[2]:
+                    track[1] = self._template(gray, track[0])
+        return [(track_id, track[0]) for track_id, track in self.tracks.items() if track[2]]
+
+    def _merge(self, boxes):
+        unmatched = dict(self.tracks)
+        for box in boxes:
+            best = max(unmatched, key=lambda t: iou(unmatched[t][0], box), default=None)
+            if best is not None and iou(unmatched[best][0], box) >= 0.3:
+                self.tracks[best][0] = box
+                self.tracks[best][2] = True
+                del unmatched[best]
+                continue
+            if len(self.tracks) >= self.max_faces:
+                lost = [t for t, track in unmatched.items() if not track[2]]
+                if not lost:
+                    continue
+                del self.tracks[min(lost)]
+                del unmatched[min(lost)]
+            self.tracks[self.track_count] = [box, None, True]
+            self.track_count += 1
+
+    def _template(self, gray, box):
+        x, y, w, h = box
+        patch = gray[max(0, y):y + h, max(0, x):x + w]
+        if patch.size == 0:
+            return None
+        scale = min(1.0, self.TEMPLATE_SIDE / float(w))
+        tmpl = cv2.resize(patch, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if tmpl.std() < self.MIN_TEMPLATE_STD:
+            return None
+        return scale, tmpl
+
+    def _follow(self, gray, box, template):
+        if template is None:
+            return None
+        scale, tmpl = template
+        x, y, w, h = box
+        mx, my = int(w * self.search_margin), int(h * self.search_margin)
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        region = gray[y0:y + h + my, x0:x + w + mx]
+        region = cv2.resize(region, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if region.shape[0] < tmpl.shape[0] or region.shape[1] < tmpl.shape[1]:
+            return None
+        scores = cv2.matchTemplate(region, tmpl, cv2.TM_CCOEFF_NORMED)
+        _, best, _, (bx, by) = cv2.minMaxLoc(scores)
+        if not np.isfinite(best) or best < self.min_match:
+            return None
+        return (x0 + int(round(bx / scale)), y0 + int(round(by / scale)), w, h)
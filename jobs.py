@@ -0,0 +1,138 @@
+# jobs.py
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobManager:
+    """
+    Background jobs for long-running predictions.
+
+    Jobs run on a bounded local thread pool, so web request threads return
+    immediately. Each job function receives a `progress(**fields)` callback
+    whose fields show up in the job's status. Job status lives in the SQLite
+    file at `path` (the prediction cache's file), so every worker process on
+    the host can answer for any job, whichever one accepted it. Finished jobs
+    are kept for `ttl` seconds and then dropped. A heartbeat thread refreshes
+    the jobs this process still owns (queued or running) every `heartbeat`
+    seconds, so an unfinished job only expires once its process has stopped
+    heartbeating for `ttl`, i.e. has exited. Submissions beyond
+    `max_pending` unfinished jobs on the host raise JobQueueFull.
+    """
+
+    def __init__(self, path, workers=2, ttl=3600, max_pending=64, heartbeat=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self.heartbeat = heartbeat if heartbeat is not None else min(60.0, ttl / 4.0)
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._local = threading.local()
+        self._owned = set()  # unfinished jobs of this process
+        self._lock = threading.Lock()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, "
+            "progress TEXT NOT NULL, result TEXT, error TEXT, created REAL NOT NULL, "
+            "updated REAL NOT NULL, finished REAL)")
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # Autocommit; submit() opens its own write transaction
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def submit(self, fn, *args, cleanup=None):
+        """Queue fn(progress, *args) and return its job id. `cleanup()` runs when it ends."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        db = self._connect()
+        # IMMEDIATE takes the write lock up front, so the pending count and
+        # the insert are atomic across processes
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            self._expire(db)
+            pending, = db.execute("SELECT COUNT(*) FROM jobs WHERE finished IS NULL").fetchone()
+            if pending >= self.max_pending:
+                raise JobQueueFull("too many pending jobs")
+            db.execute("INSERT INTO jobs (id, status, progress, created, updated) VALUES (?, 'queued', '{}', ?, ?)",
+                       (job_id, now, now))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._owned.add(job_id)
+        self._pool.submit(self._run, job_id, fn, args, cleanup)
+        return job_id
+
+    def get(self, job_id):
+        """Snapshot of a job's status, or None if unknown or expired."""
+        row = self._connect().execute(
+            "SELECT status, progress, result, error, updated, finished FROM jobs WHERE id = ?",
+            (job_id,)).fetchone()
+        if row is None:
+            return None
+        status, progress, result, error, updated, finished = row
+        cutoff = time.time() - self.ttl
+        if (finished if finished is not None else updated) < cutoff:
+            return None
+        job = {"status": status, "progress": json.loads(progress)}
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = error
+        if finished is not None:
+            job["finished"] = finished
+        return job
+
+    def _update(self, job_id, sql, *params):
+        self._connect().execute(f"UPDATE jobs SET {sql}, updated = ? WHERE id = ?",
+                                params + (time.time(), job_id))
+
+    def _run(self, job_id, fn, args, cleanup):
+        progress_fields = {}
+
+        def progress(**fields):
+            progress_fields.update(fields)
+            self._update(job_id, "progress = ?", json.dumps(progress_fields))
+
+        self._update(job_id, "status = 'running'")
+        try:
+            result = fn(progress, *args)
+            self._update(job_id, "status = 'done', result = ?, finished = ?", json.dumps(result), time.time())
+        except Exception as e:
+            self._update(job_id, "status = 'error', error = ?, finished = ?", str(e), time.time())
+        finally:
+            with self._lock:
+                self._owned.discard(job_id)
+            if cleanup is not None:
+                cleanup()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat)
+            with self._lock:
+                owned = list(self._owned)
+            if not owned:
+                continue
+            try:
+                self._connect().execute(
+                    f"UPDATE jobs SET updated = ? WHERE finished IS NULL AND id IN ({','.join('?' * len(owned))})",
+                    [time.time()] + owned)
+            except sqlite3.Error as e:
+                print("⚠️ Job heartbeat failed:", e)
+
+    def _expire(self, db):
+        cutoff = time.time() - self.ttl
+        # Unfinished jobs without a heartbeat belong to a worker that exited
+        db.execute("DELETE FROM jobs WHERE COALESCE(finished, updated) < ?", (cutoff,))
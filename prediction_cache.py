@@ -0,0 +1,199 @@
+# prediction_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: coalesce within the process only
+    fcntl = None
+
+HASH_CHUNK = 1024 * 1024
+
+
+def content_hash(data):
+    """SHA-256 hex digest of bytes or a seekable binary stream (rewound afterwards)."""
+    h = hashlib.sha256()
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        h.update(data)
+    else:
+        pos = data.tell()
+        for block in iter(lambda: data.read(HASH_CHUNK), b""):
+            h.update(block)
+        data.seek(pos)
+    return h.hexdigest()
+
+
+def file_fingerprint(*paths):
+    """Hash of the given files' contents, used as the model version."""
+    h = hashlib.sha256()
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                h.update(content_hash(f).encode())
+    return h.hexdigest()[:16]
+
+
+class PredictionCache:
+    """
+    Content-addressed cache of prediction responses.
+
+    Keys combine the upload's content hash with a namespace describing the
+    model version and pipeline config, so changing either never serves stale
+    verdicts. A small in-process LRU sits in front of a SQLite file that every
+    worker process on the host shares and that survives restarts. Disk errors
+    are logged and treated as misses; the cache never fails a request.
+    """
+
+    def __init__(self, path, namespace, max_items=1024, max_disk_items=100000):
+        self.path = path
+        self.namespace = json.dumps(namespace, sort_keys=True) if isinstance(namespace, dict) else str(namespace)
+        self.max_items = max_items
+        self.max_disk_items = max_disk_items
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._puts = 0
+        try:
+            with self._connect() as db:
+                db.execute("CREATE TABLE IF NOT EXISTS predictions "
+                           "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+        except sqlite3.Error as e:
+            print("⚠️ Prediction cache disk tier unavailable:", e)
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def key(self, digest, *parts):
+        """Cache key for an upload `digest` plus request options that change the result."""
+        raw = json.dumps([self.namespace, digest] + [str(p) for p in parts])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                return self._lru[key]
+        try:
+            row = self._connect().execute(
+                "SELECT value FROM predictions WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print("⚠️ Prediction cache read failed:", e)
+            return None
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        self._remember(key, value)
+        try:
+            with self._connect() as db:
+                db.execute("INSERT OR REPLACE INTO predictions (key, value, created) VALUES (?, ?, ?)",
+                           (key, json.dumps(value), time.time()))
+                self._puts += 1
+                if self._puts % 1000 == 0:
+                    db.execute("DELETE FROM predictions WHERE key NOT IN "
+                               "(SELECT key FROM predictions ORDER BY created DESC LIMIT ?)",
+                               (self.max_disk_items,))
+        except sqlite3.Error as e:
+            print("⚠️ Prediction cache write failed:", e)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._lru[key] = value
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_items:
+                self._lru.popitem(last=False)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent computations of the same key (e.g. the same viral
+    upload arriving many times at once).
+
+    Within the process the first caller for a key runs `fn` and later callers
+    block on its result (or its exception). With `lock_dir`, the leader also
+    takes a per-key file lock, so leaders in other worker processes on the host
+    queue behind it and re-check the shared cache via `lookup` before
+    computing anything themselves.
+    """
+
+    def __init__(self, lock_dir=None):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, lookup=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event()}
+        if not leader:
+            call["done"].wait()
+            if "error" in call:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            with self._file_lock(key):
+                result = lookup() if lookup is not None else None
+                if result is None:
+                    result = fn()
+            call["result"] = result
+            return result
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+    def _file_lock(self, key):
+        if not self.lock_dir:
+            return _NoLock()
+        # Lock files are sharded by key prefix so the directory stays bounded
+        return file_lock(os.path.join(self.lock_dir, key[:4] + ".lock"))
+
+
+def file_lock(path):
+    """Exclusive lock on `path` shared by processes on the host (no-op without fcntl)."""
+    return _FileLock(path) if fcntl is not None else _NoLock()
+
+
+class _NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+")
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        return False
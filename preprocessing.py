@@ -0,0 +1,105 @@
+# preprocessing.py
+import io
+
+import numpy as np
+from PIL import Image
+
+try:
+    import cv2
+except ImportError:  # the PIL paths work without OpenCV
+    cv2 = None
+
+REDUCTION_FACTORS = (8, 4, 2)
+# Bump when preprocessing output changes, so cached verdicts are invalidated
+PREPROCESSING_VERSION = 2
+
+
+def reduction_factor(size, target_size):
+    """
+    Largest of 8/4/2 (else 1) by which an image of `size` can be shrunk while
+    its shorter side stays at least the longer side of `target_size`, so the
+    result is never upscaled later, whatever the aspect ratio or EXIF rotation.
+    """
+    short_side = min(size)
+    need = max(target_size)
+    for factor in REDUCTION_FACTORS:
+        if short_side // factor >= need:
+            return factor
+    return 1
+
+
+def image_size(data):
+    """(width, height) from the image header only, or None if PIL can't tell."""
+    try:
+        return Image.open(io.BytesIO(data)).size
+    except Exception:
+        return None
+
+
+def decode_image_cv2(data, target_size=None):
+    """
+    Decode image bytes to a BGR array with OpenCV. With a (width, height)
+    `target_size`, JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale
+    (IMREAD_REDUCED_COLOR_*, DCT scaling in libjpeg) when that still covers
+    the target, so the full-resolution buffer is never built. Returns None
+    for undecodable data, like cv2.imdecode.
+    """
+    flag = cv2.IMREAD_COLOR
+    if target_size is not None:
+        size = image_size(data)
+        if size is not None:
+            flag = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                    4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}[reduction_factor(size, target_size)]
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+
+
+def open_image(data, target_size=None):
+    """
+    Open image bytes with PIL. With a (width, height) `target_size`, JPEGs
+    are set up with Image.draft() so they decode at the smallest 1/2-1/8 scale
+    that still covers the target; other formats decode normally.
+    """
+    image = Image.open(io.BytesIO(data))
+    if target_size is not None and image.format == "JPEG":
+        image.draft("RGB", target_size)
+    return image
+
+
+def to_rgb_float(image, size, out=None):
+    """
+    PIL image -> float32 (height, width, 3) RGB in [0, 1] at (width, height)
+    `size`, optionally written into `out`. The image is converted to RGB
+    before resizing, so palette/RGBA/grayscale inputs are interpolated in
+    colour, and scaling stays in float32 (no float64 tensor for Keras to cast).
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    pixels = np.asarray(image.resize(size), dtype=np.uint8)
+    if out is None:
+        out = np.empty(pixels.shape, dtype=np.float32)
+    np.divide(pixels, np.float32(255.0), out=out, dtype=np.float32)
+    return out
+
+
+def resize_frame(frame, size, out=None):
+    """
+    BGR frame -> uint8 (height, width, 3) at (width, height) `size`,
+    optionally written into `out`. Models fed this way scale in-graph.
+    """
+    resized = cv2.resize(frame, size)
+    if out is None:
+        return resized
+    out[...] = resized
+    return out
+
+
+def preprocess_batch(images, size, prepare=to_rgb_float, dtype=np.float32):
+    """
+    Preprocess decoded images into one contiguous, preallocated
+    (N, height, width, 3) array, each one written in place by
+    `prepare(image, size, out=row)`.
+    """
+    batch = np.empty((len(images), size[1], size[0], 3), dtype=dtype)
+    for row, image in zip(batch, images):
+        prepare(image, size, out=row)
+    return batch
@@ -0,0 +1,112 @@
+# serving.py
+import queue
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+DEFAULT_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class BucketedModel:
+    """
+    Call a Keras model through concrete functions traced once at startup for a
+    fixed set of batch sizes. Inputs are zero-padded up to the nearest bucket
+    (and split above the largest one), so nothing is retraced at request time
+    and the per-call data adapter / loop setup of model.predict() is skipped.
+    """
+
+    def __init__(self, model, buckets=DEFAULT_BUCKETS, jit_compile=False):
+        self.model = model
+        self.buckets = tuple(sorted(set(buckets)))
+        spec = model.inputs[0]
+        self.item_shape = tuple(spec.shape[1:])
+        self.dtype = tf.as_dtype(spec.dtype)
+        fn = tf.function(lambda x: model(x, training=False), jit_compile=jit_compile)
+        self._fns = {
+            b: fn.get_concrete_function(tf.TensorSpec((b,) + self.item_shape, self.dtype))
+            for b in self.buckets
+        }
+
+    def bucket_for(self, n):
+        """Smallest traced batch size that fits `n` items."""
+        for b in self.buckets:
+            if b >= n:
+                return b
+        return self.buckets[-1]
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=self.dtype.as_numpy_dtype)
+        outs = []
+        for start in range(0, len(x), self.buckets[-1]):
+            part = x[start:start + self.buckets[-1]]
+            n = len(part)
+            b = self.bucket_for(n)
+            if b != n:
+                padded = np.zeros((b,) + part.shape[1:], dtype=part.dtype)
+                padded[:n] = part
+                part = padded
+            outs.append(self._fns[b](tf.constant(part)).numpy()[:n])
+        return np.concatenate(outs, axis=0)
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent calls to `fn` from many request threads into one
+    batched call. The first pending request waits at most `max_wait` seconds
+    (or until `max_batch` rows are queued), the inputs are concatenated along
+    axis 0, `fn` runs once on a single worker thread and each caller gets its
+    own slice of the output back. Exceptions are raised in every caller of the
+    failed batch.
+    """
+
+    def __init__(self, fn, max_batch=32, max_wait=0.005):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def __call__(self, x):
+        request = {"x": np.asarray(x), "done": threading.Event()}
+        self._pending.put(request)
+        request["done"].wait()
+        if "error" in request:
+            raise request["error"]
+        return request["result"]
+
+    def _run(self):
+        while True:
+            batch = [self._pending.get()]
+            rows = len(batch[0]["x"])
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                rows += len(request["x"])
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        try:
+            if len(batch) == 1:
+                outputs = [self.fn(batch[0]["x"])]
+            else:
+                out = self.fn(np.concatenate([r["x"] for r in batch], axis=0))
+                offsets = np.cumsum([len(r["x"]) for r in batch])[:-1]
+                outputs = np.split(out, offsets)
+            for request, result in zip(batch, outputs):
+                request["result"] = result
+        except Exception as e:
+            for request in batch:
+                request["error"] = e
+        finally:
+            for request in batch:
+                request["done"].set()
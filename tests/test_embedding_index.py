@@ -0,0 +1,51 @@
+# test_embedding_index.py
+import numpy as np
+
+from embedding_index import EmbeddingIndex
+
+DIM = 16
+
+
+def vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+
+def test_finds_near_duplicates_only(tmp_path):
+    index = EmbeddingIndex(str(tmp_path), DIM, capacity=8)
+    a, b = vectors(2)
+    index.add(a, 0.9, tag=1)
+    score, similarity = index.query(a * 3 + 1e-4, tag=1)
+    assert score == np.float32(0.9) and similarity > 0.999
+    assert index.query(b, tag=1) is None
+    assert index.query(a, tag=2) is None
+
+
+def test_entries_are_shared_between_processes(tmp_path):
+    a = vectors(1)[0]
+    writer = EmbeddingIndex(str(tmp_path), DIM, capacity=8)
+    reader = EmbeddingIndex(str(tmp_path), DIM, capacity=8)
+    writer.add(a, 0.25)
+    assert reader.query(a)[0] == np.float32(0.25)
+
+
+def test_oldest_entries_are_overwritten_at_capacity(tmp_path):
+    index = EmbeddingIndex(str(tmp_path), DIM, capacity=2)
+    vecs = vectors(3)
+    for i, vec in enumerate(vecs):
+        index.add(vec, i / 10.0)
+    assert index.query(vecs[0]) is None
+    assert index.query(vecs[2])[0] == np.float32(0.2)
+
+
+def test_namespaces_never_see_each_other(tmp_path):
+    # A rolling model update: old and new workers share the directory
+    a = vectors(1)[0]
+    old = EmbeddingIndex(str(tmp_path), DIM, capacity=8, namespace="model-1")
+    old.add(a, 0.1)
+    new = EmbeddingIndex(str(tmp_path), DIM, capacity=8, namespace="model-2")
+    assert new.query(a) is None
+    new.add(a, 0.8)
+    # The old worker keeps its own entries and never picks up the new model's
+    assert old.query(a)[0] == np.float32(0.1)
+    assert EmbeddingIndex(str(tmp_path), DIM, capacity=8, namespace="model-1").query(a)[0] == np.float32(0.1)
+    assert old.dir != new.dir
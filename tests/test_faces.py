@@ -0,0 +1,75 @@
+# test_faces.py
+import numpy as np
+import pytest
+
+from faces import FaceDetector, FaceDetectorUnavailable, FaceTracker
+
+
+def test_missing_cascade_is_reported():
+    # Raised both when the cascade file is missing and when this OpenCV build
+    # has no CascadeClassifier at all
+    with pytest.raises(FaceDetectorUnavailable):
+        FaceDetector(cascade_path="/nonexistent/cascade.xml")
+
+
+def test_missing_yunet_model_is_reported():
+    with pytest.raises(FaceDetectorUnavailable):
+        FaceDetector(model_path="/nonexistent/face_detection_yunet.onnx")
+
+
+class StubDetector:
+    """Returns `boxes(frame_index)` and records which frames it ran on."""
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.frames = 0
+        self.runs = []
+
+    def detect(self, frame):
+        self.runs.append(self.frames)
+        return list(self.boxes(self.frames))
+
+
+def run_tracker(tracker, detector, n, shape=(240, 320, 3)):
+    frames = [np.zeros(shape, dtype=np.uint8) for _ in range(n)]
+    out = []
+    for i, frame in enumerate(frames):
+        detector.frames = i
+        out.append(tracker.update(frame))
+    return out
+
+
+def test_detector_runs_are_spread_over_the_planned_frames():
+    detector = StubDetector(lambda i: [])
+    tracker = FaceTracker(detector, detect_every=5, max_detections=8)
+    tracker.plan(60)
+    run_tracker(tracker, detector, 60)
+    # No face: still one run every 8 frames, not runs on frames 0-7
+    assert detector.runs == [0, 8, 16, 24, 32, 40, 48, 56]
+
+
+def test_face_appearing_late_is_found():
+    detector = StubDetector(lambda i: [(100, 80, 60, 60)] if i >= 45 else [])
+    tracker = FaceTracker(detector, detect_every=5, max_detections=8)
+    tracker.plan(60)
+    out = run_tracker(tracker, detector, 60)
+    assert out[47] == [] and out[48] == [(0, (100, 80, 60, 60))]
+
+
+def test_lost_tracks_keep_their_id():
+    # Blank frames defeat template matching, so both faces are lost right
+    # after every detection and found again by the next one
+    boxes = [(20, 20, 60, 60), (200, 100, 50, 50)]
+    detector = StubDetector(lambda i: boxes)
+    tracker = FaceTracker(detector, detect_every=5, max_detections=8)
+    out = run_tracker(tracker, detector, 30)
+    assert tracker.track_count == 2
+    assert out[0] == [(0, boxes[0]), (1, boxes[1])] and out[1] == []
+    assert out[25] == [(0, boxes[0]), (1, boxes[1])]
+
+
+def test_oldest_lost_track_makes_room_for_a_new_face():
+    detector = StubDetector(lambda i: [(20, 20, 60, 60)] if i < 5 else [(200, 100, 50, 50)])
+    tracker = FaceTracker(detector, detect_every=5, max_faces=1)
+    out = run_tracker(tracker, detector, 6)
+    assert out[5] == [(1, (200, 100, 50, 50))] and list(tracker.tracks) == [1]
@@ -0,0 +1,71 @@
+# test_jobs.py
+import threading
+import time
+
+import pytest
+
+from jobs import JobManager, JobQueueFull
+
+
+def wait_for(manager, job_id, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job is not None and job["status"] in ("done", "error"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish: {manager.get(job_id)}")
+
+
+def test_status_is_shared_between_managers(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    a, b = JobManager(path), JobManager(path)
+    job_id = a.submit(lambda progress, x: (progress(step=1), {"x": x})[1], 3)
+    job = wait_for(b, job_id)
+    assert job["status"] == "done" and job["result"] == {"x": 3} and job["progress"] == {"step": 1}
+    assert b.get("unknown") is None
+
+
+def test_errors_are_reported(tmp_path):
+    manager = JobManager(str(tmp_path / "jobs.sqlite3"))
+
+    def fail(progress):
+        raise ValueError("boom")
+
+    job = wait_for(manager, manager.submit(fail))
+    assert job["status"] == "error" and job["error"] == "boom"
+
+
+def test_pending_limit_counts_every_manager(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    release = threading.Event()
+    a = JobManager(path, workers=1, max_pending=2)
+    b = JobManager(path, workers=1, max_pending=2)
+    a.submit(lambda progress: release.wait())
+    a.submit(lambda progress: release.wait())
+    with pytest.raises(JobQueueFull):
+        b.submit(lambda progress: None)
+    release.set()
+
+
+def test_job_queued_longer_than_ttl_is_kept(tmp_path):
+    manager = JobManager(str(tmp_path / "jobs.sqlite3"), workers=1, ttl=1, heartbeat=0.2)
+    manager.submit(lambda progress: time.sleep(2.5))
+    queued = manager.submit(lambda progress: "late")
+    time.sleep(1.5)
+    manager.submit(lambda progress: None)  # expires whatever looks abandoned
+    assert manager.get(queued)["status"] == "queued"
+    assert wait_for(manager, queued)["result"] == "late"
+
+
+def test_jobs_of_an_exited_process_expire(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    manager = JobManager(path, ttl=1, heartbeat=0.2)
+    stale = time.time() - 5
+    manager._connect().execute(
+        "INSERT INTO jobs (id, status, progress, created, updated) VALUES ('gone', 'running', '{}', ?, ?)",
+        (stale, stale))
+    assert manager.get("gone") is None
+    manager.submit(lambda progress: None)
+    count, = manager._connect().execute("SELECT COUNT(*) FROM jobs WHERE id = 'gone'").fetchone()
+    assert count == 0
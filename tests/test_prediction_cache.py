@@ -0,0 +1,100 @@
+# test_prediction_cache.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from prediction_cache import PredictionCache, SingleFlight
+
+
+def test_cache_is_shared_and_namespaced(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    a = PredictionCache(path, {"model": 1})
+    key = a.key("digest", "video", "full")
+    a.put(key, {"probability": 0.7})
+    assert PredictionCache(path, {"model": 1}).get(key) == {"probability": 0.7}
+    other = PredictionCache(path, {"model": 2})
+    assert other.get(other.key("digest", "video", "full")) is None
+    assert a.get(a.key("digest", "video", "single")) is None
+
+
+@pytest.mark.parametrize("lock_dir", [None, "locks"])
+def test_concurrent_calls_run_once(tmp_path, lock_dir):
+    flight = SingleFlight(str(tmp_path / lock_dir) if lock_dir else None)
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return {"probability": 0.5}
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        leader = pool.submit(flight.do, "k", compute)
+        started.wait()
+        followers = [pool.submit(flight.do, "k", compute) for _ in range(7)]
+        results = [leader.result()] + [f.result() for f in followers]
+    assert calls == [1]
+    assert results == [{"probability": 0.5}] * 8
+
+
+def test_followers_get_the_leaders_error():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError("could not decode any frames")
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        calls = [pool.submit(flight.do, "k", fail)]
+        started.wait()
+        calls += [pool.submit(flight.do, "k", fail) for _ in range(3)]
+        for call in calls:
+            with pytest.raises(ValueError, match="could not decode"):
+                call.result()
+    # Nothing is remembered: the next call computes again
+    assert flight.do("k", lambda: 1) == 1
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flight = SingleFlight()
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        slow = pool.submit(flight.do, "a", lambda: release.wait(5) and "a")
+        assert flight.do("b", lambda: "b") == "b"
+        release.set()
+        assert slow.result() == "a"
+
+
+def test_lookup_short_circuits_the_computation(tmp_path):
+    flight = SingleFlight(str(tmp_path))
+    assert flight.do("k", lambda: pytest.fail("computed"), lookup=lambda: "cached") == "cached"
+    assert flight.do("k", lambda: "computed", lookup=lambda: None) == "computed"
+
+
+def test_file_lock_coalesces_across_instances(tmp_path):
+    # Two instances stand in for two worker processes sharing the lock dir
+    # and the prediction cache: the second leader waits for the first one's
+    # file lock, then finds the result through its lookup
+    first, second = SingleFlight(str(tmp_path / "locks")), SingleFlight(str(tmp_path / "locks"))
+    cache = {}
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        cache["k"] = "result"
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        a = pool.submit(first.do, "k", compute, lookup=lambda: cache.get("k"))
+        started.wait()
+        b = pool.submit(second.do, "k", compute, lookup=lambda: cache.get("k"))
+        assert a.result() == b.result() == "result"
+    assert calls == [1]
@@ -0,0 +1,92 @@
+# test_preprocessing.py
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from preprocessing import cv2, open_image, preprocess_batch, resize_frame, to_rgb_float
+
+SIZE = (128, 128)
+
+
+def legacy(image, size):
+    """The original deepfake pro.py preprocess_image: resize, convert, then divide in float64."""
+    image = image.resize(size)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return np.array(image) / 255.0
+
+
+@pytest.fixture
+def rgb():
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (300, 400, 3), dtype=np.uint8))
+
+
+def jpeg_bytes(image, **kwargs):
+    out = io.BytesIO()
+    image.save(out, "JPEG", **kwargs)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("mode", ["RGB", "L"])
+def test_matches_legacy_where_conversion_order_does_not_matter(rgb, mode):
+    image = rgb.convert(mode)
+    new = to_rgb_float(image, SIZE)
+    assert new.dtype == np.float32 and new.shape == (128, 128, 3)
+    assert np.abs(new - legacy(image, SIZE)).max() < 1e-6
+
+
+def test_palette_is_interpolated_in_colour(rgb):
+    palette = rgb.convert("P", palette=Image.ADAPTIVE)
+    assert np.array_equal(to_rgb_float(palette, SIZE), to_rgb_float(palette.convert("RGB"), SIZE))
+
+
+def test_opaque_rgba_matches_legacy(rgb):
+    rgba = rgb.convert("RGBA")
+    assert np.abs(to_rgb_float(rgba, SIZE) - legacy(rgba, SIZE)).max() < 1e-6
+
+
+def test_rgba_alpha_is_dropped_before_resizing(rgb):
+    # Alpha ramps from transparent to opaque across the image. It is dropped
+    # before resizing, so transparent pixels keep their colour instead of
+    # being darkened by alpha-weighted resampling as in the legacy order.
+    rgba = rgb.copy()
+    rgba.putalpha(Image.fromarray(np.tile(np.linspace(0, 255, rgb.width).astype(np.uint8), (rgb.height, 1))))
+    new = to_rgb_float(rgba, SIZE)
+    assert np.array_equal(new, to_rgb_float(rgb, SIZE))
+    assert np.abs(new - legacy(rgba, SIZE)).max() > 0.1
+
+
+def test_grayscale_jpeg_draft_decode():
+    y, x = np.mgrid[0:1200, 0:1600]
+    gray = Image.fromarray(((np.sin(x / 90.0) + np.cos(y / 70.0)) * 60 + 128).astype(np.uint8))
+    data = jpeg_bytes(gray, quality=95)
+
+    image = open_image(data, SIZE)
+    # Decoded at 1/8 scale, still covering the target, and still grayscale
+    assert image.mode == "L" and image.size == (200, 150)
+    assert open_image(data, (300, 300)).size == (400, 300)
+    assert open_image(data).size == (1600, 1200)
+
+    new = to_rgb_float(image, SIZE)
+    assert new.shape == (128, 128, 3)
+    assert np.array_equal(new[..., 0], new[..., 1]) and np.array_equal(new[..., 1], new[..., 2])
+    assert np.abs(new - to_rgb_float(Image.open(io.BytesIO(data)), SIZE)).max() < 0.02
+
+
+def test_preprocess_batch_layout(rgb):
+    images = [rgb, rgb.convert("L"), rgb.convert("RGBA"), rgb.convert("P", palette=Image.ADAPTIVE)]
+    batch = preprocess_batch(images, SIZE)
+    assert batch.shape == (4, 128, 128, 3) and batch.dtype == np.float32 and batch.flags.c_contiguous
+    for row, image in zip(batch, images):
+        assert np.array_equal(row, to_rgb_float(image, SIZE))
+
+
+@pytest.mark.skipif(cv2 is None, reason="needs OpenCV")
+def test_preprocess_batch_of_frames():
+    frame = np.random.default_rng(1).integers(0, 256, (240, 320, 3), dtype=np.uint8)
+    frames = preprocess_batch([frame, frame], (64, 48), prepare=resize_frame, dtype=np.uint8)
+    assert frames.shape == (2, 48, 64, 3)
+    assert np.array_equal(frames[1], cv2.resize(frame, (64, 48)))
@@ -0,0 +1,127 @@
+# test_uploads.py
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from uploads import BatchLimitExceeded, archive_kind, iter_batch_files, iter_batch_results
+
+KB = 1024
+
+
+def zip_part(files, name="batch.zip"):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as archive:
+        for member, data in files.items():
+            archive.writestr(member, data)
+    buf.seek(0)
+    return name, "application/zip", buf
+
+
+def tar_part(files, name="batch.tar.gz"):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as archive:
+        for member, data in files.items():
+            info = tarfile.TarInfo(member)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+        link = tarfile.TarInfo("link.jpg")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "/etc/passwd"
+        archive.addfile(link)
+    buf.seek(0)
+    return name, "application/gzip", buf
+
+
+def file_part(name, data, mimetype="image/jpeg"):
+    return name, mimetype, io.BytesIO(data)
+
+
+def test_archive_kind():
+    assert archive_kind("a.ZIP", "") == "zip"
+    assert archive_kind("upload", "application/x-zip-compressed") == "zip"
+    assert archive_kind("a.tgz", "") == "tar"
+    assert archive_kind("a.jpg", "image/jpeg") is None
+
+
+def test_expands_archives_and_plain_parts():
+    parts = [file_part("a.jpg", b"a"),
+             zip_part({"x/b.png": b"b", "c.mp4": b"c"}),
+             tar_part({"d.jpg": b"d"})]
+    files = list(iter_batch_files(parts))
+    # Member names are only reported, never used as paths; links are skipped
+    assert files == [("a.jpg", "image/jpeg", b"a"), ("x/b.png", "image/png", b"b"),
+                     ("c.mp4", "video/mp4", b"c"), ("d.jpg", "image/jpeg", b"d")]
+
+
+def test_oversized_deflated_member_is_rejected():
+    # 4 MB of zeros compresses to a few KB: the header size is checked first
+    parts = [zip_part({"bomb.jpg": b"\0" * (4096 * KB)})]
+    assert parts[0][2].getbuffer().nbytes < 64 * KB
+    with pytest.raises(BatchLimitExceeded, match="bomb.jpg"):
+        list(iter_batch_files(parts, max_item_bytes=KB))
+
+
+def test_oversized_tar_member_is_rejected_while_reading():
+    with pytest.raises(BatchLimitExceeded, match="big.jpg"):
+        list(iter_batch_files([tar_part({"big.jpg": b"\0" * (64 * KB)})], max_item_bytes=KB))
+
+
+def test_oversized_plain_part_is_rejected():
+    with pytest.raises(BatchLimitExceeded):
+        list(iter_batch_files([file_part("a.jpg", b"x" * (KB + 1))], max_item_bytes=KB))
+
+
+def test_too_many_files():
+    parts = [zip_part({f"{i}.jpg": b"x" for i in range(5)})]
+    files = iter_batch_files(parts, max_items=3)
+    assert len([next(files) for _ in range(3)]) == 3
+    with pytest.raises(BatchLimitExceeded, match="more than 3 files"):
+        next(files)
+
+
+def test_total_size_limit():
+    parts = [file_part(f"{i}.jpg", b"x" * KB) for i in range(3)]
+    with pytest.raises(BatchLimitExceeded, match="larger than"):
+        list(iter_batch_files(parts, max_total_bytes=2 * KB))
+
+
+@pytest.mark.parametrize("name, mimetype", [("bad.zip", "application/zip"), ("bad.tar.gz", "application/gzip")])
+def test_corrupt_archive(name, mimetype):
+    with pytest.raises(ValueError, match="could not read archive"):
+        list(iter_batch_files([(name, mimetype, io.BytesIO(b"not an archive" * 10))]))
+
+
+def score_sizes(group):
+    return [{"size": len(data)} for _, _, data in group]
+
+
+def test_results_are_scored_in_groups():
+    groups = []
+
+    def score(group):
+        groups.append(len(group))
+        return score_sizes(group)
+
+    parts = [file_part(f"{i}.jpg", b"x" * i) for i in range(5)]
+    results = list(iter_batch_results(parts, score, group_size=2))
+    assert groups == [2, 2, 1]
+    assert results == [{"size": i, "index": i, "name": f"{i}.jpg"} for i in range(5)]
+
+
+def test_partial_results_then_error():
+    # The files read before the limit is hit are still scored, then the error surfaces
+    parts = [file_part(f"{i}.jpg", b"x") for i in range(5)]
+    results = iter_batch_results(parts, score_sizes, group_size=2, max_items=3)
+    assert [r["index"] for r in (next(results), next(results), next(results))] == [0, 1, 2]
+    with pytest.raises(BatchLimitExceeded):
+        next(results)
+
+
+def test_partial_results_then_corrupt_archive():
+    parts = [file_part("a.jpg", b"a"), ("bad.zip", "application/zip", io.BytesIO(b"garbage"))]
+    results = iter_batch_results(parts, score_sizes, group_size=32)
+    assert next(results)["name"] == "a.jpg"
+    with pytest.raises(ValueError, match="could not read archive"):
+        next(results)
@@ -0,0 +1,183 @@
+# uploads.py
+import mimetypes
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+from flask import Request
+
+SHM_DIR = "/dev/shm"
+DEFAULT_MAX_MEMORY = 64 * 1024 * 1024
+ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
+TAR_TYPES = ("application/x-tar", "application/gzip", "application/x-gzip", "application/x-bzip2", "application/x-xz")
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+class BatchLimitExceeded(ValueError):
+    pass
+
+
+class InMemoryUploadRequest(Request):
+    """
+    Flask request class that keeps uploaded files of up to `max_memory` bytes
+    in RAM. Werkzeug's default spools anything over 500 KB to a temp file,
+    which would put a disk write in front of every video upload.
+    """
+
+    max_memory = DEFAULT_MAX_MEMORY
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=self.max_memory, mode="rb+")
+
+
+def stream_size(stream):
+    """Bytes left in a seekable stream."""
+    pos = stream.tell()
+    size = stream.seek(0, os.SEEK_END) - pos
+    stream.seek(pos)
+    return size
+
+
+class UploadFile:
+    """
+    A filesystem path holding the rest of `stream`, for readers that only take
+    paths (cv2.VideoCapture). Up to `max_memory` bytes go to an anonymous
+    in-memory file (memfd, opened through /proc/self/fd/N) or, without
+    memfd, to /dev/shm; only larger uploads are written to a real temp file
+    in `dir`. Use as a context manager, or call close().
+    """
+
+    def __init__(self, stream, suffix="", max_memory=DEFAULT_MAX_MEMORY, dir=None):
+        in_memory = stream_size(stream) <= max_memory
+        self._remove = False
+        if in_memory and hasattr(os, "memfd_create"):
+            self.fd = os.memfd_create("upload" + suffix)
+            self.path = f"/proc/self/fd/{self.fd}"
+        else:
+            tmp_dir = SHM_DIR if in_memory and os.path.isdir(SHM_DIR) else dir
+            self.fd, self.path = tempfile.mkstemp(suffix=suffix, dir=tmp_dir)
+            self._remove = True
+        try:
+            with os.fdopen(os.dup(self.fd), "wb") as out:
+                shutil.copyfileobj(stream, out)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self.fd is None:
+            return
+        os.close(self.fd)
+        self.fd = None
+        if self._remove:
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def archive_kind(filename, mimetype):
+    """"zip", "tar" or None for an uploaded part."""
+    name = (filename or "").lower()
+    if name.endswith(".zip") or mimetype in ZIP_TYPES:
+        return "zip"
+    if name.endswith(TAR_SUFFIXES) or mimetype in TAR_TYPES:
+        return "tar"
+    return None
+
+
+def _read_capped(f, name, limit):
+    data = f.read(limit + 1)
+    if len(data) > limit:
+        raise BatchLimitExceeded(f"{name} is larger than {limit} bytes")
+    return data
+
+
+def iter_batch_files(parts, max_items=500, max_item_bytes=DEFAULT_MAX_MEMORY, max_total_bytes=1024 ** 3):
+    """
+    Yield (name, mimetype, bytes) for every uploaded file in `parts`
+    ((filename, mimetype, stream) tuples), expanding zip and tar archives in
+    memory.
+
+    Archive members are read, never extracted, so their paths cannot escape
+    anywhere; only regular files are read (no links, devices or nested
+    archive expansion). Every read is capped at `max_item_bytes` whatever the
+    archive header claims, so compression bombs stop early.
+    BatchLimitExceeded is raised once a file is too large or there are more
+    than `max_items` files or `max_total_bytes` in total.
+    """
+    count = 0
+    total = 0
+
+    def take(name, mimetype, f):
+        nonlocal count, total
+        count += 1
+        if count > max_items:
+            raise BatchLimitExceeded(f"more than {max_items} files in one batch")
+        data = _read_capped(f, name, max_item_bytes)
+        total += len(data)
+        if total > max_total_bytes:
+            raise BatchLimitExceeded(f"batch is larger than {max_total_bytes} bytes")
+        if not mimetype or mimetype == "application/octet-stream":
+            mimetype = mimetypes.guess_type(name)[0] or ""
+        return name, mimetype, data
+
+    for filename, mimetype, stream in parts:
+        kind = archive_kind(filename, mimetype)
+        try:
+            if kind == "zip":
+                with zipfile.ZipFile(stream) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir():
+                            continue
+                        if info.file_size > max_item_bytes:
+                            raise BatchLimitExceeded(f"{info.filename} is larger than {max_item_bytes} bytes")
+                        with archive.open(info) as member:
+                            yield take(info.filename, None, member)
+            elif kind == "tar":
+                with tarfile.open(fileobj=stream, mode="r:*") as archive:
+                    for info in archive:
+                        if info.isfile():
+                            yield take(info.name, None, archive.extractfile(info))
+            else:
+                yield take(filename or "", mimetype, stream)
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError, RuntimeError, NotImplementedError) as e:
+            # Corrupt, truncated, encrypted or unsupported archives
+            raise ValueError(f"could not read archive {filename}: {e}") from e
+
+
+def iter_batch_results(parts, score_group, group_size=32, **limits):
+    """
+    Expand a batch request with iter_batch_files(parts, **limits) and score
+    it `group_size` files at a time with score_group([(name, mimetype,
+    bytes), ...]) -> [result dict, ...], yielding each result tagged with
+    its "index" and "name". Only one group is held in memory. When a limit
+    is exceeded or an archive is unreadable, the files read before it are
+    still scored and then the error is re-raised.
+    """
+    def scored(group, start):
+        for index, ((name, _, _), result) in enumerate(zip(group, score_group(group)), start):
+            yield dict(result, index=index, name=name)
+
+    items = iter_batch_files(parts, **limits)
+    start = 0
+    group = []
+    while True:
+        try:
+            item = next(items, None)
+        except Exception:
+            yield from scored(group, start)
+            raise
+        if item is None:
+            break
+        group.append(item)
+        if len(group) == group_size:
+            yield from scored(group, start)
+            start += len(group)
+            group = []
+    yield from scored(group, start)